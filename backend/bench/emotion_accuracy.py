@@ -0,0 +1,87 @@
+"""Accuracy and speed of the alternative emotion runtimes against the fp32 PyTorch pipeline.
+
+    python -m bench.emotion_corpus --per-label 20     # once: labelled CREMA-D clips
+    python -m bench.emotion_accuracy --runtimes int8,onnx,onnx-int8
+
+Every WAV in the corpus (default bench/.emotion_corpus; any directory of
+labelled speech, see bench/emotion_corpus.label_of) is classified by each
+runtime. The script reports accuracy against the labels, top-1 agreement with
+the torch pipeline, the mean and max absolute score difference over all labels,
+and the mean latency. It exits non-zero if agreement is below --min-agreement or
+accuracy drops more than --max-accuracy-drop below torch.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+from bench.emotion_corpus import CORPUS_DIR, label_of
+from services.emotion_fusion import _canonical
+from services.emotion_models import AUDIO_MODEL
+from services.emotion_runtime import build_audio_model
+
+
+def _scores(preds):
+    return {p["label"]: p["score"] for p in preds}
+
+
+def run(model, files, top_k):
+    model(files[0], top_k=top_k)  # warm-up
+    out, total = [], 0.0
+    for f in files:
+        t0 = time.perf_counter()
+        out.append(model(f, top_k=top_k))
+        total += time.perf_counter() - t0
+    return out, total / len(files)
+
+
+def accuracy(preds, labels):
+    return sum(_canonical(p[0]["label"]) == label for p, label in zip(preds, labels)) / len(labels)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runtimes", default="int8,onnx")
+    ap.add_argument("--corpus", default=CORPUS_DIR, help="directory of labelled speech WAVs (fixed evaluation set)")
+    ap.add_argument("--min-agreement", type=float, default=0.95)
+    ap.add_argument("--max-accuracy-drop", type=float, default=0.02)
+    args = ap.parse_args()
+
+    runtimes = [r for r in args.runtimes.split(",") if r]
+    models = {r: build_audio_model(AUDIO_MODEL, r) for r in ["torch"] + runtimes}  # unknown runtimes fail here
+    files = sorted(glob.glob(os.path.join(args.corpus, "**", "*.wav"), recursive=True))
+    labelled = [(f, label_of(f)) for f in files]
+    files = [f for f, label in labelled if label]
+    labels = [label for _, label in labelled if label]
+    if not files:
+        sys.exit(f"No labelled WAV files in {args.corpus} (fetch some with: python -m bench.emotion_corpus)")
+    print(f"{len(files)} clips, " + ", ".join(f"{l}={labels.count(l)}" for l in sorted(set(labels))))
+
+    reference = models["torch"]
+    n_labels = len(reference.model.config.id2label)
+    ref_preds, ref_latency = run(reference, files, n_labels)
+    ref_accuracy = accuracy(ref_preds, labels)
+    print(f"{'runtime':<11}{'accuracy':>9}{'top1 agree':>11}{'mean |Δp|':>11}{'max |Δp|':>10}{'latency':>10}{'speedup':>9}")
+    print(f"{'torch':<11}{ref_accuracy:>9.3f}{1.0:>11.3f}{0.0:>11.4f}{0.0:>10.4f}{ref_latency:>9.3f}s{1.0:>8.2f}x")
+
+    failed = False
+    for runtime in runtimes:
+        preds, latency = run(models[runtime], files, n_labels)
+        agree, diffs = 0, []
+        for ref, got in zip(ref_preds, preds):
+            agree += ref[0]["label"] == got[0]["label"]
+            a, b = _scores(ref), _scores(got)
+            diffs.extend(abs(a[k] - b.get(k, 0.0)) for k in a)
+        agreement = agree / len(files)
+        runtime_accuracy = accuracy(preds, labels)
+        failed |= agreement < args.min_agreement or runtime_accuracy < ref_accuracy - args.max_accuracy_drop
+        print(f"{runtime:<11}{runtime_accuracy:>9.3f}{agreement:>11.3f}{sum(diffs) / len(diffs):>11.4f}{max(diffs):>10.4f}"
+              f"{latency:>9.3f}s{ref_latency / latency:>8.2f}x")
+
+    if failed:
+        sys.exit(f"Top-1 agreement below {args.min_agreement} or accuracy more than {args.max_accuracy_drop} below torch")
+
+
+if __name__ == "__main__":
+    main()
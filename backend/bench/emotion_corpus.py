@@ -0,0 +1,88 @@
+"""Small labelled speech-emotion evaluation set for bench/emotion_accuracy.py.
+
+    python -m bench.emotion_corpus --per-label 20
+
+Downloads clips from CREMA-D (acted English sentences by 91 actors, 16 kHz mono
+WAV, Open Database License: https://github.com/CheyneyComputerScience/CREMA-D)
+into bench/.emotion_corpus. The selection is deterministic: the first actors
+and sentences for each of its six emotions. Labels come from the file names, so
+RAVDESS files (03-01-05-...wav) or any <label>/<clip>.wav tree work as well.
+"""
+import argparse
+import os
+import re
+import sys
+import urllib.error
+import urllib.request
+
+from services.emotion_fusion import _canonical
+
+CORPUS_DIR = os.path.join("bench", ".emotion_corpus")
+CREMA_D_URL = "https://media.githubusercontent.com/media/CheyneyComputerScience/CREMA-D/master/AudioWAV"
+CREMA_D_EMOTIONS = ("ANG", "DIS", "FEA", "HAP", "NEU", "SAD")
+CREMA_D_SENTENCES = ("IEO", "TIE", "IOM", "IWW", "TAI", "MTI", "IWL", "ITH", "DFA", "ITS", "TSI", "WSI")
+RAVDESS_EMOTIONS = {"01": "neutral", "02": "calm", "03": "happy", "04": "sad",
+                    "05": "angry", "06": "fearful", "07": "disgust", "08": "surprised"}
+
+
+def label_of(path: str):
+    """Canonical emotion label (see services/emotion_fusion.LABELS) from a clip's file name."""
+    name = os.path.basename(path)
+    m = re.match(r"^\d{4}_[A-Z]{3}_([A-Z]{3})_", name)  # CREMA-D: 1001_DFA_ANG_XX.wav
+    if m:
+        return _canonical(m.group(1))
+    m = re.match(r"^\d\d-\d\d-(\d\d)-", name)  # RAVDESS: 03-01-05-01-01-01-01.wav
+    if m:
+        return _canonical(RAVDESS_EMOTIONS.get(m.group(1), ""))
+    return _canonical(os.path.basename(os.path.dirname(path)))  # <label>/<clip>.wav
+
+
+def _clip_names():
+    """CREMA-D file names, interleaving actors and sentences so a prefix is varied."""
+    for i in range(91 * len(CREMA_D_SENTENCES)):
+        actor = 1001 + i % 91
+        sentence = CREMA_D_SENTENCES[i % len(CREMA_D_SENTENCES)]
+        for emotion in CREMA_D_EMOTIONS:
+            yield emotion, f"{actor}_{sentence}_{emotion}_{'HI' if sentence == 'IEO' and emotion != 'NEU' else 'XX'}.wav"
+
+
+def fetch_crema_d(dest: str = CORPUS_DIR, per_label: int = 20, base_url: str = CREMA_D_URL):
+    os.makedirs(dest, exist_ok=True)
+    have = {e: 0 for e in CREMA_D_EMOTIONS}
+    for emotion, name in _clip_names():
+        if all(n >= per_label for n in have.values()):
+            break
+        if have[emotion] >= per_label:
+            continue
+        path = os.path.join(dest, name)
+        if not os.path.exists(path):
+            try:
+                with urllib.request.urlopen(f"{base_url}/{name}", timeout=30) as resp:
+                    data = resp.read()
+            except urllib.error.HTTPError as e:
+                if e.code == 404:
+                    continue  # a few actor/sentence/emotion combinations were not recorded
+                raise
+            if not data.startswith(b"RIFF"):
+                raise RuntimeError(f"{name}: not a WAV file (is {base_url} serving Git LFS content?)")
+            with open(path + ".part", "wb") as f:
+                f.write(data)
+            os.replace(path + ".part", path)
+        have[emotion] += 1
+    return have
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--dest", default=CORPUS_DIR)
+    ap.add_argument("--per-label", type=int, default=20)
+    ap.add_argument("--base-url", default=CREMA_D_URL, help="CREMA-D AudioWAV directory (mirror or local http server)")
+    args = ap.parse_args()
+    counts = fetch_crema_d(args.dest, args.per_label, args.base_url)
+    print(f"{sum(counts.values())} clips in {args.dest}: " + ", ".join(f"{e}={n}" for e, n in counts.items()))
+    if min(counts.values()) < args.per_label:
+        sys.exit("Fewer clips than requested for some labels")
+
+
+if __name__ == "__main__":
+    main()
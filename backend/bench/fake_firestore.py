@@ -0,0 +1,136 @@
+"""In-memory stand-in for the subset of the Firestore client API the routers use."""
+import copy
+import threading
+import time
+import uuid
+from datetime import datetime
+
+_lock = threading.RLock()
+
+
+def _resolve(value):
+    # firestore.SERVER_TIMESTAMP is a Sentinel object; store a real timestamp instead
+    if type(value).__name__ == "Sentinel":
+        return datetime.utcnow()
+    if isinstance(value, dict):
+        return {k: _resolve(v) for k, v in value.items()}
+    return value
+
+
+class FakeSnapshot:
+    def __init__(self, ref, data):
+        self.reference = ref
+        self.id = ref.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, db, path, doc_id):
+        self._db = db
+        self.path = f"{path}/{doc_id}"
+        self.id = doc_id
+
+    def collection(self, name):
+        return FakeCollection(self._db, f"{self.path}/{name}")
+
+    def set(self, data, merge=False):
+        self._db._sleep()
+        with _lock:
+            cur = self._db._docs.get(self.path) if merge else None
+            self._db._docs[self.path] = {**(cur or {}), **_resolve(copy.deepcopy(data))}
+            self._db.writes += 1
+
+    def update(self, data):
+        self._db._sleep()
+        with _lock:
+            if self.path not in self._db._docs:
+                raise KeyError(f"No document to update: {self.path}")
+            self._db._docs[self.path].update(_resolve(copy.deepcopy(data)))
+            self._db.writes += 1
+
+    def get(self):
+        self._db._sleep()
+        with _lock:
+            self._db.reads += 1
+            return FakeSnapshot(self, copy.deepcopy(self._db._docs.get(self.path)))
+
+    def delete(self):
+        with _lock:
+            self._db._docs.pop(self.path, None)
+
+
+class FakeQuery:
+    def __init__(self, coll, filters=(), order=None, limit=None):
+        self._coll = coll
+        self._filters = list(filters)
+        self._order = order
+        self._limit = limit
+
+    def where(self, field, op, value):
+        return FakeQuery(self._coll, self._filters + [(field, op, value)], self._order, self._limit)
+
+    def order_by(self, field, direction="ASCENDING"):
+        return FakeQuery(self._coll, self._filters, (field, direction), self._limit)
+
+    def limit(self, n):
+        return FakeQuery(self._coll, self._filters, self._order, n)
+
+    def stream(self):
+        db = self._coll._db
+        db._sleep()
+        ops = {"==": lambda a, b: a == b, "<": lambda a, b: a < b, ">": lambda a, b: a > b,
+               "<=": lambda a, b: a <= b, ">=": lambda a, b: a >= b}
+        prefix = self._coll.path + "/"
+        with _lock:
+            rows = [
+                (p[len(prefix):], copy.deepcopy(d)) for p, d in db._docs.items()
+                if p.startswith(prefix) and "/" not in p[len(prefix):]
+            ]
+            db.reads += len(rows)
+        rows = [r for r in rows if all(f in r[1] and ops[op](r[1][f], v) for f, op, v in self._filters)]
+        if self._order:
+            field, direction = self._order
+            rows.sort(key=lambda r: r[1].get(field) or datetime.min, reverse=str(direction).upper() == "DESCENDING")
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        for doc_id, data in rows:
+            yield FakeSnapshot(FakeDocument(db, self._coll.path, doc_id), data)
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db, path):
+        super().__init__(self)
+        self._db = db
+        self.path = path
+
+    def document(self, doc_id=None):
+        return FakeDocument(self._db, self.path, doc_id or uuid.uuid4().hex[:20])
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return datetime.utcnow(), ref
+
+
+class FakeFirestore:
+    """Thread-safe, in-memory Firestore with an optional per-call latency (ms)."""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self._docs = {}
+        self.reads = 0
+        self.writes = 0
+
+    def _sleep(self):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+
+    def collection(self, name):
+        return FakeCollection(self, name)
@@ -0,0 +1,59 @@
+"""Import-time budget check for the app module.
+
+    python -m bench.import_time --budget 1.5
+
+Imports `main` in a fresh interpreter with `-X importtime`, prints the slowest
+top-level packages and exits non-zero if the total exceeds the budget. Heavy
+dependencies (transformers/torch, firebase_admin, google.generativeai, openai)
+must stay out of the import path; they are loaded lazily or at warm-up.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+HEAVY = ("torch", "transformers", "firebase_admin", "google.cloud.firestore", "google.generativeai", "openai")
+
+
+def measure(module="main"):
+    env = {**os.environ, "WARM_MODELS": "0", "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "import-check")}
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, env=env)
+    if proc.returncode != 0:
+        errors = [l for l in proc.stderr.splitlines() if not l.startswith("import time:")]
+        raise SystemExit(f"import {module} failed:\n" + "\n".join(errors[-20:]))
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|", 2)
+        # one leading space for top-level imports, more for nested ones
+        rows.append((name[1:], int(cumulative_us)))
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--module", default="main")
+    ap.add_argument("--budget", type=float, default=float(os.getenv("IMPORT_BUDGET_S", "1.5")))
+    ap.add_argument("--top", type=int, default=15)
+    args = ap.parse_args()
+
+    rows = measure(args.module)
+    top_level = [(n, us) for n, us in rows if not n.startswith(" ")]
+    total = sum(us for _, us in top_level) / 1e6
+    leaked = sorted({n.strip() for n, _ in rows if n.strip() in HEAVY})
+
+    print(f"Slowest top-level imports for `import {args.module}`:")
+    for name, us in sorted(top_level, key=lambda r: -r[1])[:args.top]:
+        print(f"  {us / 1e6:7.3f}s  {name}")
+    print(f"Total: {total:.3f}s (budget {args.budget:.3f}s)")
+    if leaked:
+        print(f"Heavy modules imported eagerly: {', '.join(leaked)}")
+
+    if total > args.budget or leaked:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
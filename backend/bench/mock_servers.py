@@ -0,0 +1,205 @@
+"""Local HTTP stand-ins for the Whisper and Gemini REST APIs with latency/error profiles."""
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Per-service latency (ms) ~ max(0, gauss(mean, jitter)); error_rate returns 500s,
+# throttle_rate returns 429s (the Gemini client falls through to the next model).
+PROFILES = {
+    "instant": {
+        "whisper": {"mean_ms": 0, "jitter_ms": 0, "ms_per_audio_sec": 0, "error_rate": 0, "throttle_rate": 0},
+        "gemini": {"mean_ms": 0, "jitter_ms": 0, "error_rate": 0, "throttle_rate": 0},
+    },
+    "realistic": {
+        "whisper": {"mean_ms": 400, "jitter_ms": 150, "ms_per_audio_sec": 25, "error_rate": 0.0, "throttle_rate": 0.0},
+        "gemini": {"mean_ms": 2500, "jitter_ms": 800, "error_rate": 0.0, "throttle_rate": 0.0},
+    },
+    "degraded": {
+        "whisper": {"mean_ms": 1200, "jitter_ms": 600, "ms_per_audio_sec": 60, "error_rate": 0.03, "throttle_rate": 0.02},
+        "gemini": {"mean_ms": 6000, "jitter_ms": 3000, "error_rate": 0.05, "throttle_rate": 0.10},
+    },
+}
+
+FAKE_QUESTIONS = [
+    "Tell me about yourself.",
+    "Describe a difficult bug you fixed.",
+    "How do you prioritise competing deadlines?",
+    "Explain the difference between a process and a thread.",
+    "Tell me about a time you disagreed with a teammate.",
+    "How would you design a URL shortener?",
+    "What is your biggest weakness?",
+    "Why do you want this role?",
+]
+
+FAKE_FEEDBACK = {
+    "fileName": "", "duration": "", "overallScore": 72, "grade": "B", "performanceLevel": "Proficient",
+    "aiConfidence": 80, "speechQuality": 75,
+    "keyStrengths": ["Clear structure", "Relevant examples"],
+    "areasForImprovement": ["Quantify impact", "Shorter answers"],
+    "performanceBreakdown": [
+        {"category": "Communication", "score": 74, "summary": "Mostly clear.", "suggestions": ["Pause between points"]},
+    ],
+    "immediateActionItems": ["Practice STAR answers"],
+    "longTermDevelopment": ["Mock system design interviews"],
+}
+
+FAKE_SUMMARY = {
+    "overallScore": 70, "summary": "Solid session.", "strengths": ["Communication"],
+    "weaknesses": ["Depth"], "recommendedImprovements": ["Add metrics to answers"],
+}
+
+WORDS = "so I think the main thing we did was measure first and then we improved the design".split()
+
+
+class _Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def hit(self, key):
+        with self.lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+
+
+def _delay(cfg, extra_ms=0.0):
+    ms = max(0.0, random.gauss(cfg["mean_ms"], cfg["jitter_ms"])) + extra_ms
+    if ms:
+        time.sleep(ms / 1000.0)
+
+
+def _fault(cfg):
+    r = random.random()
+    if r < cfg.get("error_rate", 0):
+        return 500
+    if r < cfg.get("error_rate", 0) + cfg.get("throttle_rate", 0):
+        return 429
+    return None
+
+
+def _make_handler(profile, stats):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body):
+            raw = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def _body(self):
+            n = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(n) if n else b""
+
+        def do_GET(self):
+            if self.path.startswith("/v1beta/models"):
+                stats.hit("gemini.list")
+                models = [{"name": f"models/{m}", "supportedGenerationMethods": ["generateContent"]}
+                          for m in ("gemini-2.5-flash", "gemini-2.0-flash")]
+                return self._send(200, {"models": models})
+            self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            body = self._body()
+            if self.path.startswith("/v1/audio/transcriptions"):
+                return self._whisper(body)
+            m = re.match(r"^/v1beta/models/([^:/?]+):generateContent", self.path)
+            if m:
+                return self._gemini(m.group(1), body)
+            self._send(404, {"error": "not found"})
+
+        def _whisper(self, body):
+            cfg = profile["whisper"]
+            stats.hit("whisper")
+            # 16 kHz mono 16-bit WAV is ~32 KB per second of audio
+            audio_sec = len(body) / 32000.0
+            _delay(cfg, cfg.get("ms_per_audio_sec", 0) * audio_sec)
+            status = _fault(cfg)
+            if status:
+                return self._send(status, {"error": {"message": "injected fault"}})
+            n_words = max(5, int(audio_sec * 2.5))
+            text = " ".join(WORDS[i % len(WORDS)] for i in range(n_words)) + "."
+            self._send(200, {"text": text})
+
+        def _gemini(self, model, body):
+            cfg = profile["gemini"]
+            stats.hit(f"gemini.{model}")
+            _delay(cfg)
+            status = _fault(cfg)
+            if status:
+                return self._send(status, {"error": {"code": status, "message": "injected fault"}})
+            try:
+                payload = json.loads(body)
+                prompt = payload["contents"][0]["parts"][0]["text"]
+            except Exception:
+                payload, prompt = {}, ""
+            # Static instructions arrive as a system instruction
+            system = payload.get("systemInstruction")
+            if system:
+                prompt = system["parts"][0]["text"] + "\n" + prompt
+            if "JSON array" in prompt:
+                text = json.dumps(FAKE_QUESTIONS)
+            elif "overallScore" in prompt and "recommendedImprovements" in prompt:
+                text = json.dumps(FAKE_SUMMARY)
+            elif "overallScore" in prompt:
+                text = json.dumps(FAKE_FEEDBACK)
+            else:
+                text = "Summary: " + " ".join(prompt.split()[:40])
+            self._send(200, {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]})
+
+    return Handler
+
+
+class MockUpstreams:
+    """Starts Whisper- and Gemini-compatible servers on background threads."""
+
+    def __init__(self, profile="realistic", host="127.0.0.1", port=0):
+        self.profile = PROFILES[profile] if isinstance(profile, str) else profile
+        self.stats = _Stats()
+        self.server = ThreadingHTTPServer((host, port), _make_handler(self.profile, self.stats))
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self):
+        """Environment variables that point the backend at these stand-ins."""
+        return {
+            "WHISPER_URL": f"{self.base_url}/v1/audio/transcriptions",
+            "OPENAI_BASE_URL": f"{self.base_url}/v1",
+            "GEMINI_API_BASE": self.base_url,
+            "OPENAI_API_KEY": "bench",
+            "GOOGLE_API_KEY": "bench",
+        }
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Run the Whisper/Gemini stand-ins standalone.")
+    ap.add_argument("--profile", default="realistic", choices=sorted(PROFILES))
+    ap.add_argument("--port", type=int, default=8900)
+    args = ap.parse_args()
+    with MockUpstreams(args.profile, port=args.port) as m:
+        print(f"Mock upstreams on {m.base_url} ({args.profile})")
+        for k, v in m.env().items():
+            print(f"  {k}={v}")
+        m.thread.join()
@@ -0,0 +1,243 @@
+"""End-to-end load benchmark against local stand-ins for Whisper, Gemini and Firestore.
+
+Run from backend/:
+
+    python -m bench.run_bench --scenarios analyze,practice --concurrency 1,4,16 --profile realistic
+
+Starts the mock upstreams in-process, launches `serve.py --app bench.server:app` as a
+subprocess pointed at them, drives each scenario at each concurrency level and
+reports p50/p95/p99 latency, throughput and peak server RSS.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import httpx
+
+from bench.mock_servers import PROFILES, MockUpstreams
+from bench.synth_audio import ensure_corpus
+
+SCENARIOS = ("analyze", "emotion", "transcribe", "practice")
+
+
+# ========= SERVER PROCESS =========
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(c) for c in f.read().split()]
+    except OSError:
+        return []
+
+
+def _rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def tree_rss_bytes(pid):
+    """RSS of a process plus all its descendants (uvicorn --workers forks)."""
+    total, stack = 0, [pid]
+    while stack:
+        p = stack.pop()
+        total += _rss_kb(p)
+        stack.extend(_children(p))
+    return total * 1024
+
+
+class RssSampler:
+    def __init__(self, pid, interval=0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, tree_rss_bytes(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = tree_rss_bytes(self.pid)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def start_server(env, port, workers, ready_path="/readyz"):
+    cmd = [sys.executable, "serve.py", "--app", "bench.server:app", "--port", str(port),
+           "--log-level", "warning", "--workers", str(workers)]
+    proc = subprocess.Popen(cmd, env={**os.environ, **env})
+    deadline = time.time() + 600  # model loading on first run can be slow
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with code {proc.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}{ready_path}", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError("Server did not become ready in time")
+
+
+# ========= SCENARIOS =========
+def _audio_part(path):
+    with open(path, "rb") as f:
+        return (f"{uuid.uuid4().hex}_{os.path.basename(path)}", f.read(), "audio/wav")
+
+
+async def _analyze(client, audio):
+    r = await client.post("/analyze", files={"file": _audio_part(audio)}, data={"user_id": "bench-user"})
+    r.raise_for_status()
+
+
+async def _emotion(client, audio):
+    r = await client.post("/emotion", files={"file": _audio_part(audio)})
+    r.raise_for_status()
+
+
+async def _transcribe(client, audio):
+    r = await client.post("/transcribe", files={"file": _audio_part(audio)})
+    r.raise_for_status()
+
+
+async def _practice(client, audio, answers=3):
+    uid = f"bench-{uuid.uuid4().hex[:8]}"
+    r = await client.get("/practice/start", params={"role": "software_developer", "uid": uid})
+    r.raise_for_status()
+    start = r.json()
+    for i in range(answers):
+        name, data, ctype = _audio_part(audio)
+        r = await client.post("/practice/answer", files={"file": (name, data, ctype)}, data={
+            "sessionId": start["sessionId"], "uid": uid, "questionIndex": str(i),
+            "question": start["questions"][i], "skipped": "false",
+        })
+        r.raise_for_status()
+    r = await client.post("/practice/finish", data={"sessionId": start["sessionId"], "uid": uid})
+    r.raise_for_status()
+
+
+RUNNERS = {"analyze": _analyze, "emotion": _emotion, "transcribe": _transcribe, "practice": _practice}
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    s = sorted(values)
+    k = (len(s) - 1) * p / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+
+async def run_level(base_url, scenario, audio, concurrency, n_requests, timeout):
+    latencies, errors = [], []
+    sem = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def one():
+            async with sem:
+                t0 = time.perf_counter()
+                try:
+                    await RUNNERS[scenario](client, audio)
+                    latencies.append(time.perf_counter() - t0)
+                except Exception as e:
+                    errors.append(f"{type(e).__name__}: {e}"[:200])
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(n_requests)))
+        wall = time.perf_counter() - t0
+
+    return {
+        "ok": len(latencies),
+        "errors": len(errors),
+        "sampleErrors": errors[:3],
+        "wallSeconds": round(wall, 3),
+        "rps": round(len(latencies) / wall, 3) if wall else 0.0,
+        "p50": round(percentile(latencies, 50), 3),
+        "p95": round(percentile(latencies, 95), 3),
+        "p99": round(percentile(latencies, 99), 3),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS))
+    ap.add_argument("--concurrency", default="1,4,16")
+    ap.add_argument("--requests", type=int, default=20, help="requests per scenario/level/duration")
+    ap.add_argument("--durations", default="5,30", help="synthetic audio lengths in seconds")
+    ap.add_argument("--profile", default="realistic", choices=sorted(PROFILES))
+    ap.add_argument("--profile-json", help="JSON object overriding fields of the chosen profile")
+    ap.add_argument("--firestore-latency-ms", type=float, default=15.0)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--emotion-backend", default="local", choices=("local", "server"),
+                    help="server = one shared inference process for all workers")
+    ap.add_argument("--port", type=int, default=8800)
+    ap.add_argument("--timeout", type=float, default=600.0)
+    ap.add_argument("--audio-dir", default=os.path.join("bench", ".audio"))
+    ap.add_argument("--out", help="write results as JSON to this path")
+    args = ap.parse_args()
+
+    profile = json.loads(json.dumps(PROFILES[args.profile]))
+    for svc, overrides in json.loads(args.profile_json or "{}").items():
+        profile[svc].update(overrides)
+
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    levels = [int(c) for c in args.concurrency.split(",")]
+    corpus = ensure_corpus(args.audio_dir, [float(d) for d in args.durations.split(",")])
+
+    results = []
+    with MockUpstreams(profile) as upstreams:
+        env = {**upstreams.env(), "FAKE_FIRESTORE_LATENCY_MS": str(args.firestore_latency_ms),
+               "EMOTION_BACKEND": args.emotion_backend}
+        t0 = time.perf_counter()
+        proc = start_server(env, args.port, args.workers)
+        print(f"Server ready in {time.perf_counter() - t0:.1f}s (idle RSS {tree_rss_bytes(proc.pid) / 2**20:.0f} MiB)")
+        base_url = f"http://127.0.0.1:{args.port}"
+        try:
+            header = f"{'scenario':<11}{'audio':>7}{'conc':>6}{'ok':>6}{'err':>5}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'peakRSS':>10}"
+            print(header)
+            print("-" * len(header))
+            for scenario in scenarios:
+                for seconds, audio in corpus.items():
+                    for c in levels:
+                        with RssSampler(proc.pid) as rss:
+                            res = asyncio.run(run_level(base_url, scenario, audio, c, args.requests, args.timeout))
+                        res.update({"scenario": scenario, "audioSeconds": seconds, "concurrency": c,
+                                    "peakRssBytes": rss.peak})
+                        results.append(res)
+                        print(f"{scenario:<11}{seconds:>6.0f}s{c:>6}{res['ok']:>6}{res['errors']:>5}{res['rps']:>9.2f}"
+                              f"{res['p50']:>9.2f}{res['p95']:>9.2f}{res['p99']:>9.2f}{rss.peak / 2**20:>8.0f}Mi")
+                        for e in res["sampleErrors"]:
+                            print(f"    ! {e}")
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    print(f"Upstream calls: {upstreams.stats.calls}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"profile": profile, "workers": args.workers, "results": results,
+                       "upstreamCalls": upstreams.stats.calls}, f, indent=2)
+        print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""ASGI entrypoint that serves the real app backed by the in-memory Firestore fake.
+
+    uvicorn bench.server:app --port 8800
+
+Upstream URLs come from the environment (see MockUpstreams.env()).
+With OBJECT_STORAGE_BACKEND=local, BENCH_STORAGE_LATENCY_MS / BENCH_STORAGE_BANDWIDTH_MBPS
+throttle the object store, and POST /bench/upload/spooled is the UploadFile
+baseline for bench/upload_bench.py --http.
+"""
+import os
+
+from fastapi import File, UploadFile
+
+import main
+from bench.fake_firestore import FakeFirestore
+from services import firestore_client, object_storage
+
+fake_db = FakeFirestore(latency_ms=float(os.getenv("FAKE_FIRESTORE_LATENCY_MS", "0")))
+firestore_client.set_db(fake_db)
+
+if object_storage.OBJECT_STORAGE_BACKEND == "local":
+    object_storage.set_backend(object_storage.LocalBackend(
+        latency_ms=float(os.getenv("BENCH_STORAGE_LATENCY_MS", "0")),
+        bandwidth_mbps=float(os.getenv("BENCH_STORAGE_BANDWIDTH_MBPS", "0")),
+    ))
+
+app = main.app
+
+
+@app.post("/bench/upload/spooled", status_code=202, include_in_schema=False)
+async def upload_spooled(file: UploadFile = File(...)):
+    """/upload/cloud as it was: Starlette spools the body before the handler runs."""
+    job = await object_storage.upload_stream(file, f"uploads/spooled_{os.path.basename(file.filename)}", make_public=False)
+    return job.to_dict()
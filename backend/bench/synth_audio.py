@@ -0,0 +1,62 @@
+"""Synthetic speech-like WAV files (16 kHz mono PCM) for benchmarking."""
+import math
+import os
+import random
+import struct
+import wave
+
+SAMPLE_RATE = 16000
+
+
+def synth_speech(seconds: float, seed: int = 0):
+    """Voiced 'syllables' (harmonic stack with a wandering pitch) separated by pauses."""
+    rng = random.Random(seed)
+    total = int(seconds * SAMPLE_RATE)
+    out = [0.0] * total
+    i = 0
+    while i < total:
+        syl = int(rng.uniform(0.12, 0.35) * SAMPLE_RATE)
+        pitch = rng.uniform(95, 220)
+        for n in range(min(syl, total - i)):
+            env = math.sin(math.pi * n / syl)
+            t = n / SAMPLE_RATE
+            f0 = pitch * (1 + 0.05 * math.sin(2 * math.pi * 3 * t))
+            out[i + n] = env * (
+                0.6 * math.sin(2 * math.pi * f0 * t)
+                + 0.25 * math.sin(2 * math.pi * 2 * f0 * t)
+                + 0.1 * math.sin(2 * math.pi * 3 * f0 * t)
+            ) + 0.01 * rng.uniform(-1, 1)
+        i += syl + int(rng.uniform(0.03, 0.4) * SAMPLE_RATE)
+    return out
+
+
+def write_wav(path: str, samples):
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(b"".join(struct.pack("<h", int(max(-1.0, min(1.0, s)) * 32000)) for s in samples))
+    return path
+
+
+def ensure_corpus(out_dir: str, durations=(5, 30, 120)):
+    """Create (or reuse) one synthetic clip per duration; returns {seconds: path}."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+    for d in durations:
+        path = os.path.join(out_dir, f"synth_{int(d)}s.wav")
+        if not os.path.exists(path):
+            write_wav(path, synth_speech(d, seed=int(d)))
+        paths[d] = path
+    return paths
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out", default="bench/.audio")
+    ap.add_argument("--durations", default="5,30,120,600")
+    args = ap.parse_args()
+    for d, p in ensure_corpus(args.out, [float(x) for x in args.durations.split(",")]).items():
+        print(f"{d:>6}s  {p}")
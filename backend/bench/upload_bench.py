@@ -0,0 +1,232 @@
+"""Offline throughput benchmark for object-storage uploads (services/object_storage.py).
+
+    python -m bench.upload_bench --size-mb 256 --chunk-mb 8 --concurrency 1,4,8 --latency-ms 40 --bandwidth-mbps 200
+
+Uploads a random file to a LocalBackend that simulates per-request latency and
+per-connection bandwidth, comparing the old path (read whole body, write a temp
+file, single-stream upload) with resumable and parallel composite uploads.
+Reports seconds until the request could return, total seconds and MB/s.
+
+    python -m bench.upload_bench --http --size-mb 256 --concurrency 8 --latency-ms 40 --bandwidth-mbps 200
+
+--http measures the real endpoint instead: it starts `serve.py --app bench.server:app`
+against a throttled local object store (using the highest --concurrency) and
+posts the file as multipart/form-data to POST /upload/cloud, which parses the
+body as it arrives, and to POST /bench/upload/spooled, which takes an UploadFile
+like /upload/cloud used to. It also reports the peak bytes the server held in
+temp files and the peak server RSS.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from services import object_storage
+from services.object_storage import LocalBackend
+
+
+def _digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(2**20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class FileSource:
+    """Stands in for UploadFile: async read(n) over a file on disk."""
+
+    def __init__(self, path):
+        self.f = open(path, "rb")
+
+    async def read(self, n=-1):
+        return self.f.read(n)
+
+    def close(self):
+        self.f.close()
+
+
+async def _legacy(path, backend, name):
+    # What upload_to_firebase did before: whole body in memory, temp copy, one stream
+    t0 = time.perf_counter()
+    src = FileSource(path)
+    data = await src.read()
+    src.close()
+    with tempfile.NamedTemporaryFile(delete=False) as tmp:
+        tmp.write(data)
+    with open(tmp.name, "rb") as f:
+        backend.write_part(name, f.read())
+    os.remove(tmp.name)
+    total = time.perf_counter() - t0
+    return {"readSeconds": round(total, 3), "seconds": round(total, 3)}
+
+
+async def _streamed(path, mode, name):
+    src = FileSource(path)
+    job = await object_storage.upload_stream(src, name, mode=mode, make_public=False)
+    src.close()
+    await asyncio.get_running_loop().run_in_executor(None, job.done.wait)
+    if job.error:
+        raise RuntimeError(job.error)
+    return {"readSeconds": job.read_seconds, "seconds": job.seconds, "parts": job.parts}
+
+
+class TempFileSampler:
+    """Peak bytes in files a server process holds open under its TMPDIR.
+
+    Spooled uploads are anonymous (unlinked) temp files, so they are found
+    through /proc/<pid>/fd rather than by listing the directory.
+    """
+
+    def __init__(self, pid, path, interval=0.05):
+        self.pid = pid
+        self.path = path
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _size(self):
+        from bench.run_bench import _children
+
+        total, stack = 0, [self.pid]
+        while stack:
+            pid = stack.pop()
+            stack.extend(_children(pid))
+            fd_dir = f"/proc/{pid}/fd"
+            try:
+                fds = os.listdir(fd_dir)
+            except OSError:
+                continue
+            for fd in fds:
+                try:
+                    if os.readlink(os.path.join(fd_dir, fd)).startswith(self.path + os.sep):
+                        total += os.stat(os.path.join(fd_dir, fd)).st_size
+                except OSError:
+                    pass
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._size())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def _post(client, path, src):
+    t0 = time.perf_counter()
+    with open(src, "rb") as f:  # httpx streams file objects in the multipart body
+        r = client.post(path, files={"file": ("input.bin", f, "audio/wav")})
+    r.raise_for_status()
+    read = time.perf_counter() - t0
+    job = r.json()
+    while job["status"] == "uploading":
+        time.sleep(0.05)
+        job = client.get(f"/upload/cloud/{job['jobId']}").json()
+    if job["status"] != "completed":
+        raise RuntimeError(job["error"])
+    return job, {"readSeconds": round(read, 3), "seconds": round(time.perf_counter() - t0, 3), "parts": job["parts"]}
+
+
+def _http(args, src, work, expected, size_mb):
+    import httpx
+
+    from bench.run_bench import RssSampler, start_server
+
+    bucket, tmpdir = os.path.join(work, "bucket"), os.path.join(work, "server-tmp")
+    os.makedirs(tmpdir)
+    concurrency = max(int(c) for c in args.concurrency.split(","))
+    env = {
+        "OBJECT_STORAGE_BACKEND": "local", "OBJECT_STORAGE_DIR": bucket,
+        "BENCH_STORAGE_LATENCY_MS": str(args.latency_ms), "BENCH_STORAGE_BANDWIDTH_MBPS": str(args.bandwidth_mbps),
+        "UPLOAD_CHUNK_MB": str(args.chunk_mb), "UPLOAD_CONCURRENCY": str(concurrency),
+        "STORAGE_MANAGER": "0", "TMPDIR": tmpdir,
+    }
+    proc = start_server(env, args.port, 1, ready_path="/healthz")
+    results = []
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{args.port}", timeout=None) as client:
+            for mode, path in (("spooled", "/bench/upload/spooled"), ("streamed", "/upload/cloud")):
+                with RssSampler(proc.pid) as rss, TempFileSampler(proc.pid, tmpdir) as tmp:
+                    job, r = _post(client, path, src)
+                if _digest(os.path.join(bucket, job["name"])) != expected:
+                    raise SystemExit(f"{mode}: uploaded object differs from the source")
+                r.update({"mode": mode, "concurrency": concurrency, "mbPerSecond": round(size_mb / r["seconds"], 1),
+                          "peakTempMb": round(tmp.peak / 2**20, 1), "peakRssMb": round(rss.peak / 2**20, 1)})
+                results.append(r)
+                print(f"{mode:>10} x{concurrency:<3} request {r['readSeconds']:7.2f}s  total {r['seconds']:7.2f}s  "
+                      f"{r['mbPerSecond']:8.1f} MB/s  temp {r['peakTempMb']:7.1f} MB  rss {r['peakRssMb']:7.1f} MB")
+    finally:
+        proc.terminate()
+        proc.wait()
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--size-mb", type=float, default=128)
+    ap.add_argument("--chunk-mb", type=float, default=8)
+    ap.add_argument("--concurrency", default="1,4,8")
+    ap.add_argument("--latency-ms", type=float, default=40)
+    ap.add_argument("--bandwidth-mbps", type=float, default=200, help="per connection; 0 = unthrottled")
+    ap.add_argument("--http", action="store_true", help="benchmark POST /upload/cloud through a running server")
+    ap.add_argument("--port", type=int, default=8811)
+    ap.add_argument("--out", help="write results as JSON")
+    args = ap.parse_args()
+
+    object_storage.UPLOAD_CHUNK_BYTES = max(1, round(args.chunk_mb * 4)) * 256 * 1024
+    work = tempfile.mkdtemp(prefix="upload-bench-")
+    src = os.path.join(work, "input.bin")
+    with open(src, "wb") as f:
+        for _ in range(int(args.size_mb)):
+            f.write(os.urandom(2**20))
+    size_mb = os.path.getsize(src) / 2**20
+    expected = _digest(src)
+    if args.http:
+        try:
+            results = _http(args, src, work, expected, size_mb)
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump({"sizeMb": size_mb, "chunkMb": args.chunk_mb, "http": True, "results": results}, f, indent=2)
+        return
+    backend = LocalBackend(os.path.join(work, "bucket"), args.latency_ms, args.bandwidth_mbps)
+    object_storage.set_backend(backend)
+
+    runs = [("legacy", None)] + [("resumable", None)] + [("composite", int(c)) for c in args.concurrency.split(",")]
+    results = []
+    try:
+        for mode, concurrency in runs:
+            name = f"bench/{mode}-{concurrency or 1}.bin"
+            if mode == "legacy":
+                r = asyncio.run(_legacy(src, backend, name))
+            else:
+                object_storage.UPLOAD_CONCURRENCY = concurrency or 1
+                r = asyncio.run(_streamed(src, mode, name))
+            if _digest(backend._path(name)) != expected:
+                raise SystemExit(f"{mode}: uploaded object differs from the source")
+            r.update({"mode": mode, "concurrency": concurrency or 1, "mbPerSecond": round(size_mb / r["seconds"], 1)})
+            results.append(r)
+            print(f"{mode:>10} x{r['concurrency']:<3} request {r['readSeconds']:7.2f}s  total {r['seconds']:7.2f}s  {r['mbPerSecond']:8.1f} MB/s")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"sizeMb": size_mb, "chunkMb": args.chunk_mb, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,50 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from routers import upload, transcribe, emotion, analyze, ai_practice 
+from fastapi.responses import JSONResponse
+from routers import upload, transcribe, emotion, analyze, ai_practice, batch, metrics as metrics_router
+from services import metrics, emotion_models, firestore_client, storage
+from services.scheduler import Overloaded
 from dotenv import load_dotenv  
 import os                      
+import re
+import threading
+import time
 
-app = FastAPI(title="Interview Analyzer Backend")
+# Heavy dependencies (transformers/torch, firebase, Gemini SDK) load lazily.
+# With WARM_MODELS=1 (default) they are warmed in a background thread at startup so
+# the process is live immediately and becomes ready once the models are loaded.
+WARM_MODELS = os.getenv("WARM_MODELS", "1") == "1"
+# Background eviction/archival of uploads/ (see services/storage.py)
+STORAGE_MANAGER = os.getenv("STORAGE_MANAGER", "1") == "1"
+_warmup = {"started": None, "finished": None, "error": None}
+# Client-supplied trace IDs end up in headers, logs and /debug/traces keys
+TRACE_ID_RE = re.compile(r"[A-Za-z0-9-]{1,64}")
+
+
+def _warm():
+    _warmup["started"] = time.time()
+    try:
+        firestore_client.get_db()
+        emotion_models.warm()
+    except Exception as e:
+        print(f"❌ Warm-up failed: {e}")
+        _warmup["error"] = str(e)
+    finally:
+        _warmup["finished"] = time.time()
+        metrics.set_gauge("warmup_seconds", round(_warmup["finished"] - _warmup["started"], 3))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARM_MODELS:
+        threading.Thread(target=_warm, name="model-warmup", daemon=True).start()
+    if STORAGE_MANAGER:
+        storage.manager.start()
+    yield
+
+
+app = FastAPI(title="Interview Analyzer Backend", lifespan=lifespan)
 
 # CORS setup
 app.add_middleware(
@@ -12,15 +52,73 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id", "Retry-After"],
 )
 
+
+# Overload from the scheduler → 429 with a Retry-After hint instead of queueing forever
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(
+        {"detail": str(exc), "resource": exc.resource, "reason": exc.reason},
+        status_code=429,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+# Trace ID per request so a slow job can be broken down via /debug/traces/{id}
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    trace_id = request.headers.get("X-Trace-Id")
+    if not trace_id or not TRACE_ID_RE.fullmatch(trace_id):
+        trace_id = None  # malformed: start a fresh one
+    trace_id = metrics.new_trace(trace_id)
+    metrics.add_gauge("http_requests_in_flight", 1)
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Trace-Id"] = trace_id
+        return response
+    finally:
+        metrics.add_gauge("http_requests_in_flight", -1)
+        route = request.scope.get("route")
+        metrics.observe(
+            "http_request_duration_seconds",
+            time.perf_counter() - t0,
+            route=getattr(route, "path", "unmatched"),
+            method=request.method,
+            status=status,
+        )
+
 # Register routers
 app.include_router(upload.router)
 app.include_router(transcribe.router)
 app.include_router(emotion.router)
 app.include_router(analyze.router)
+app.include_router(batch.router)
 app.include_router(ai_practice.router)  
+app.include_router(metrics_router.router)
                                                                                                             
 @app.get("/")
 def root():
     return {"message": "Backend running successfully!"}
+
+
+@app.get("/healthz")
+def liveness():
+    """Process is up and serving requests (models may still be loading)."""
+    return {"status": "alive"}
+
+
+@app.get("/readyz")
+def readiness():
+    """Models are warm and Firestore is connected; 503 until then."""
+    checks = {
+        "models": emotion_models.status(),
+        "firestore": firestore_client.is_ready(),
+        "warmup": _warmup,
+    }
+    ready = all(checks["models"].values()) and checks["firestore"]
+    return JSONResponse({"ready": ready, **checks}, status_code=200 if ready else 503)
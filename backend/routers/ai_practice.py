@@ -4,35 +4,72 @@ from datetime import datetime
 import os
 import json
 import uuid
-import google.generativeai as genai
 
-from firebase_admin import firestore
 from routers.analyze import (
     to_wav,
     probe_duration,
     whisper_transcribe,
+    fs_set,
+    fs_update,
 )
-from services.emotion_analyzer import analyze_emotion
+from services.transcript_compactor import compact_transcript
+from services.emotion_fusion import fuse_answer, fuse_session
+from services import metrics, scheduler, idempotency, storage
+from services.firestore_client import get_db
+from services.role_catalog import catalog
 
 router = APIRouter()
-db = firestore.client()
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE")
+_genai = None
+_models = {}  # system instruction -> GenerativeModel
 
 PRIMARY_MODEL = "gemini-2.5-flash"
 FALLBACK_MODEL = "gemini-2.0-flash"
 
+# Token budget for the full-session transcript in the summary prompt
+SUMMARY_TRANSCRIPT_TOKENS = int(os.getenv("SUMMARY_TRANSCRIPT_TOKENS", "4500"))
+
+FINISH_RESOURCES = ("cpu", "asr", "llm")
 BASE_DIR = os.path.abspath(os.path.join(os.getcwd(), "uploads", "practice"))
 os.makedirs(BASE_DIR, exist_ok=True)
 
 
-def _get_model():
+def _genai_module():
+    """Import and configure the Gemini SDK on first use (it is slow to import)."""
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+
+        if GOOGLE_API_KEY:
+            if GEMINI_API_BASE:
+                # Local stand-in (see bench/mock_servers.py) speaks the REST API only
+                genai.configure(api_key=GOOGLE_API_KEY, transport="rest", client_options={"api_endpoint": GEMINI_API_BASE})
+            else:
+                genai.configure(api_key=GOOGLE_API_KEY)
+        _genai = genai
+    return _genai
+
+
+def _get_model(system: str = None):
+    """GenerativeModel, optionally with a fixed system instruction (reused per instruction)."""
+    if system in _models:
+        return _models[system]
+    genai = _genai_module()
+    kwargs = {"system_instruction": system} if system else {}
     try:
-        return genai.GenerativeModel(PRIMARY_MODEL)
+        model = genai.GenerativeModel(PRIMARY_MODEL, **kwargs)
     except Exception:
-        return genai.GenerativeModel(FALLBACK_MODEL)
+        model = genai.GenerativeModel(FALLBACK_MODEL, **kwargs)
+    if len(_models) < 256:
+        _models[system] = model
+    return model
+
+
+def _generate(model, prompt: str):
+    with scheduler.slot("llm", "gemini"), metrics.stage("llm", model=getattr(model, "model_name", PRIMARY_MODEL).replace("models/", "")):
+        return model.generate_content(prompt)
 
 
 def _json_array(text: str):
@@ -49,7 +86,7 @@ def _get_last_session_for_role(uid: str, role: str):
     from existing practiceSessions collection.
     """
     coll = (
-        db.collection("users")
+        get_db().collection("users")
         .document(uid)
         .collection("practiceSessions")
     )
@@ -58,10 +95,11 @@ def _get_last_session_for_role(uid: str, role: str):
         # Filter by role and order by createdAt desc
         query = (
             coll.where("role", "==", role)
-            .order_by("createdAt", direction=firestore.Query.DESCENDING)
+            .order_by("createdAt", direction="DESCENDING")
             .limit(1)
         )
-        docs = list(query.stream())
+        with metrics.stage("firestore", op="query"):
+            docs = list(query.stream())
         if not docs:
             return None, None
         doc = docs[0]
@@ -71,6 +109,12 @@ def _get_last_session_for_role(uid: str, role: str):
         return None, None
 
 
+@router.get("/practice/roles")
+def practice_roles():
+    """Roles that have a template in data/role_templates."""
+    return [{"id": role_id, "title": title} for role_id, title in catalog.roles()]
+
+
 # ---------------------- START PRACTICE (ADAPTIVE) ----------------------
 @router.get("/practice/start")
 def start_practice(
@@ -135,22 +179,19 @@ def start_practice(
         else:
              focus_instruction = "Balanced mix of behavioral and technical questions."
 
+    # Static role instructions are precomputed by the catalog and sent as the
+    # system instruction; only the per-round configuration varies per request
     prompt = f"""
-    You are an expert AI interview coach.
-    Role: {role}
     Round: {round_number}
-    
+
     CONFIGURATION:
     - Difficulty Strategy: {diff_instruction}
     - Focus Strategy: {focus_instruction}
-
-    Task: Generate exactly 8 realistic interview questions.
-    Return ONLY a JSON array of strings. No markdown, no keys, just the list.
     """
 
-    model = _get_model()
+    model = _get_model(catalog.questions_prefix(role))
     try:
-        res = model.generate_content(prompt)
+        res = _generate(model, prompt)
         questions = _json_array(res.text)[:8]
     except Exception as e:
         print(f"[practice/start] Gemini failed, using fallback. Error: {e}")
@@ -174,7 +215,8 @@ def start_practice(
     os.makedirs(sess_dir, exist_ok=True)
 
     # Save Session Metadata
-    db.collection("users").document(uid).collection("practiceSessions").document(session_id).set({
+    session_ref = get_db().collection("users").document(uid).collection("practiceSessions").document(session_id)
+    fs_set(session_ref, {
         "role": role,
         "roundNumber": round_number,
         "config": {
@@ -186,6 +228,7 @@ def start_practice(
         "previousScore": prev_score,
         "questions": questions,
         "createdAt": datetime.utcnow(),
+        "traceId": metrics.current_trace_id(),
         "complete": False,
         "perQuestion": []
     })
@@ -209,8 +252,9 @@ async def practice_answer(
     skipped: str = Form(...),
     file: UploadFile = File(None),
 ):
-    session_ref = db.collection("users").document(uid).collection("practiceSessions").document(sessionId)
-    snap = session_ref.get()
+    session_ref = get_db().collection("users").document(uid).collection("practiceSessions").document(sessionId)
+    with metrics.stage("firestore", op="get"):
+        snap = session_ref.get()
 
     if not snap.exists:
         raise HTTPException(404, "Session not found")
@@ -228,7 +272,7 @@ async def practice_answer(
             "skipped": True,
             "timestamp": datetime.utcnow()
         })
-        session_ref.update({"perQuestion": per})
+        fs_update(session_ref, {"perQuestion": per})
         return {"ok": True}
 
     # must have audio
@@ -241,8 +285,10 @@ async def practice_answer(
     filename = f"q{questionIndex + 1}.webm"
     raw_path = os.path.join(sess_dir, filename)
 
-    with open(raw_path, "wb") as f:
-        f.write(await file.read())
+    with metrics.stage("upload"):
+        with open(raw_path, "wb") as f:
+            f.write(await file.read())
+    storage.manager.written(raw_path)
 
     per.append({
         "questionIndex": questionIndex,
@@ -253,16 +299,47 @@ async def practice_answer(
         "timestamp": datetime.utcnow()
     })
 
-    session_ref.update({"perQuestion": per})
+    fs_update(session_ref, {"perQuestion": per})
     return {"ok": True}
 
 
 # ---------------------- FINISH & ANALYZE ----------------------
 @router.post("/practice/finish")
-def practice_finish(sessionId: str = Form(...), uid: str = Form(...)):
+def practice_finish(
+    sessionId: str = Form(...),
+    uid: str = Form(...),
+):
+    # A double-clicked "finish" waits for the first run instead of analysing every
+    # answer twice; only the run that does the work is admitted by the scheduler
+
+    key = idempotency.make_key("finish", uid, sessionId)
+    while True:
+        entry, owner = idempotency.store.begin(key)
+        if owner:
+            break
+        if not entry.done.wait(idempotency.IDEMPOTENCY_WAIT_S):
+            return JSONResponse({"status": "processing", "deduplicated": True}, status_code=202)
+        if entry.result is not None:
+            return {**entry.result, "deduplicated": True}
 
-    session_ref = db.collection("users").document(uid).collection("practiceSessions").document(sessionId)
-    snap = session_ref.get()
+    try:
+        scheduler.admit(uid, FINISH_RESOURCES)
+        try:
+            with storage.manager.pin(os.path.join(BASE_DIR, uid, sessionId)):
+                result = _finish_session(sessionId, uid)
+        finally:
+            scheduler.finish(uid)
+    except BaseException:
+        idempotency.store.fail(entry)
+        raise
+    idempotency.store.complete(entry, result)
+    return result
+
+
+def _finish_session(sessionId: str, uid: str):
+    session_ref = get_db().collection("users").document(uid).collection("practiceSessions").document(sessionId)
+    with metrics.stage("firestore", op="get"):
+        snap = session_ref.get()
 
     if not snap.exists:
         raise HTTPException(404, "Session not found")
@@ -273,6 +350,8 @@ def practice_finish(sessionId: str = Form(...), uid: str = Form(...)):
 
     combined = []
     per_q = []
+    fused_answers = []
+    raws = []
 
     for a in sorted(answers, key=lambda x: x["questionIndex"]):
         q_idx = a["questionIndex"]
@@ -287,14 +366,24 @@ def practice_finish(sessionId: str = Form(...), uid: str = Form(...)):
             per_q.append({"questionIndex": q_idx, "question": q_text, "skipped": True})
             continue
 
-        raw = a["filePath"]
+        raw = storage.resolve(a["filePath"])
+        raws.append(raw)
         wav = raw + ".wav"
 
-        to_wav(raw, wav)
-        duration = probe_duration(raw)
-        transcript = whisper_transcribe(wav)
-        emo = analyze_emotion(wav)
-        label, score = emo if isinstance(emo, tuple) else ("neutral", 0.5)
+        with storage.temp_files(wav):
+            to_wav(raw, wav)
+            duration = probe_duration(raw)
+            transcript = whisper_transcribe(wav)
+            try:
+                fused = fuse_answer(wav, transcript)
+            except Exception as e:
+                print(f"⚠️ Emotion fusion failed for Q{q_idx+1}: {e}")
+                fused = None
+        if fused:
+            fused_answers.append(fused)
+            emotion = {k: fused[k] for k in ("label", "confidence", "text", "audio", "distribution", "sentences")}
+        else:
+            emotion = {"label": "neutral", "confidence": 0.0}
 
         combined.append(f"Q{q_idx+1}: {q_text}\n{transcript}")
         per_q.append({
@@ -303,25 +392,33 @@ def practice_finish(sessionId: str = Form(...), uid: str = Form(...)):
             "transcript": transcript,
             "skipped": False,
             "duration": duration,
-            "emotion": {"label": label, "confidence": score},
+            "emotion": emotion,
         })
 
+    session_emotion = fuse_session(fused_answers)
+
     transcript_text = "\n\n".join(combined)
 
     model = _get_model()
     summary_json = {}
+    compaction = None
 
     if not model:
         print("‼ ERROR: Gemini model could not be initialized. Check API key and configuration.")
         summary_json = {"error": "AI model unavailable"}
     else:
         try:
+            transcript_text, compaction = compact_transcript(
+                transcript_text,
+                lambda p: _generate(model, p).text,
+                SUMMARY_TRANSCRIPT_TOKENS,
+            )
             prompt = f"""
             You are an AI interview coach. Analyze this full mock interview transcript.
             Some questions may be marked [SKIPPED] — ignore those when scoring.
 
             Transcript:
-            \"\"\"{transcript_text[:18000]}\"\"\" 
+            \"\"\"{transcript_text}\"\"\" 
 
             Return ONLY valid JSON with this schema:
             {{
@@ -337,7 +434,7 @@ def practice_finish(sessionId: str = Form(...), uid: str = Form(...)):
             print(prompt)
             print("------------------------------------------")
 
-            out = model.generate_content(prompt)
+            out = _generate(model, prompt)
             raw_text = (out.text or "").strip() 
 
             if raw_text.startswith("```"):
@@ -352,11 +449,18 @@ def practice_finish(sessionId: str = Form(...), uid: str = Form(...)):
             summary_json = {"error": "Failed to generate AI summary."}
 
     # Persist completion + summary + per-question results
-    session_ref.update({
+    fs_update(session_ref, {
         "complete": True,
         "completedAt": datetime.utcnow(),
         "summary": summary_json,
-        "perQuestion": per_q
+        "perQuestion": per_q,
+        "emotion": session_emotion,
+        "compaction": compaction,
+        "traceId": metrics.current_trace_id(),
+        "timings": metrics.trace_timings(),
     })
 
-    return {"status": "completed", "summary": summary_json, "perQuestion": per_q}
\ No newline at end of file
+    # Answers are only re-read if the session is finished again; keep a compact copy
+    storage.manager.archive_later(*raws)
+
+    return {"status": "completed", "summary": summary_json, "perQuestion": per_q, "emotion": session_emotion}
\ No newline at end of file
@@ -1,10 +1,15 @@
 # routers/analyze.py
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks
-import os, json, tempfile, requests, ffmpeg, time, re
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from typing import Optional
+import os, json, tempfile, requests, ffmpeg, re
 from dotenv import load_dotenv
-from transformers import pipeline
-import firebase_admin
-from firebase_admin import credentials, firestore
+from services import metrics, scheduler, idempotency, storage
+from services.scheduler import Overloaded
+from services.emotion_models import get_audio_model
+from services.firestore_client import get_db, server_timestamp
+from services.transcript_compactor import compact_transcript
 
 load_dotenv()
 router = APIRouter()    
@@ -12,53 +17,41 @@ router = APIRouter()
 # ========= CONFIG =========
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-FIREBASE_CREDENTIALS = "firebase-service-account.json"
 
 if not OPENAI_API_KEY:
     raise RuntimeError("OPENAI_API_KEY missing in environment")
 
-WHISPER_URL = "https://api.openai.com/v1/audio/transcriptions"
+# Overridable so the benchmark suite (bench/) can point at local stand-ins
+WHISPER_URL = os.getenv("WHISPER_URL", "https://api.openai.com/v1/audio/transcriptions")
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com").rstrip("/")
 
-# Emotion model (loaded once)
-EMOTION_MODEL = pipeline(
-    "audio-classification",
-    model="r-f/wav2vec-english-speech-emotion-recognition"
-)
+ANALYZE_RESOURCES = ("cpu", "asr", "llm")
 
-# ========= FIRESTORE INIT =========
-db = None
-abs_path = os.path.abspath(FIREBASE_CREDENTIALS)
-print(f"🧩 Checking Firestore credentials at: {abs_path}")
+# Transcripts longer than this are map-reduce summarised before the feedback call
+FEEDBACK_TRANSCRIPT_TOKENS = int(os.getenv("FEEDBACK_TRANSCRIPT_TOKENS", "2000"))
 
-if FIREBASE_CREDENTIALS and os.path.exists(abs_path):
-    try:
-        if not firebase_admin._apps:
-            cred = credentials.Certificate(abs_path)
-            firebase_admin.initialize_app(cred)
-        db = firestore.client()
-        print("✅ Firestore initialized successfully.")
-    except Exception as e:
-        print(f"❌ Firestore init failed: {e}")
-else:
-    print("⚠️ Firestore disabled — credentials file missing or incorrect path.")
+# Emotion model and Firestore are initialised lazily (see services/emotion_models.py
+# and services/firestore_client.py) and warmed up by the lifespan hook in main.py.
 
 
 
 # ========= HELPERS =========
 def to_wav(src_path: str, dst_path: str):
     """Convert any audio file to mono 16kHz WAV (for Whisper + wav2vec)."""
-    (
-        ffmpeg
-        .input(src_path)
-        .output(dst_path, format="wav", ac=1, ar="16000")
-        .overwrite_output()
-        .run(quiet=True)
-    )
+    with metrics.stage("ffmpeg"):
+        (
+            ffmpeg
+            .input(src_path)
+            .output(dst_path, format="wav", ac=1, ar="16000")
+            .overwrite_output()
+            .run(quiet=True)
+        )
 
 def probe_duration(path: str) -> str:
     """Return duration as mm:ss string."""
     try:
-        info = ffmpeg.probe(path)
+        with metrics.stage("probe"):
+            info = ffmpeg.probe(path)
         sec = float(info["format"]["duration"])
         m, s = divmod(int(round(sec)), 60)
         return f"{m:02d}:{s:02d}"
@@ -67,7 +60,7 @@ def probe_duration(path: str) -> str:
 
 def whisper_transcribe(wav_path: str) -> str:
     """Send WAV to Whisper API for transcription."""
-    with open(wav_path, "rb") as audio_file:
+    with scheduler.slot("asr", "whisper"), metrics.stage("asr"), open(wav_path, "rb") as audio_file:
         headers = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
         data = {"model": "whisper-1"}
         r = requests.post(WHISPER_URL, headers=headers, data=data, files={"file": audio_file})
@@ -77,7 +70,8 @@ def whisper_transcribe(wav_path: str) -> str:
 
 def detect_emotion(wav_path: str):
     """Detect dominant emotion using wav2vec model."""
-    res = EMOTION_MODEL(wav_path)
+    with scheduler.slot("cpu"), metrics.stage("emotion"):
+        res = get_audio_model()(wav_path)
     res = sorted(res, key=lambda x: x["score"], reverse=True)
     top = res[0]
     return top["label"], float(top["score"]), res
@@ -85,8 +79,8 @@ def detect_emotion(wav_path: str):
 
 
 # ========= GEMINI REST CALL (FIXED) =========
-def gemini_generate(prompt: str, model: str = None) -> str:
-    """Use REST API for Gemini (AI Studio key format)."""
+def gemini_generate(prompt: str, model: str = None, system: str = None) -> str:
+    """Use REST API for Gemini (AI Studio key format). `system` is a static instruction prefix."""
     if not GOOGLE_API_KEY:
         print("  GOOGLE_API_KEY missing — Gemini skipped.")
         return None
@@ -105,13 +99,17 @@ def gemini_generate(prompt: str, model: str = None) -> str:
     last_error = None
     
     for model_name in models_to_try:
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent?key={GOOGLE_API_KEY}"
+        url = f"{GEMINI_API_BASE}/v1beta/models/{model_name}:generateContent?key={GOOGLE_API_KEY}"
         headers = {"Content-Type": "application/json"}
         payload = {"contents": [{"parts": [{"text": prompt}]}]}
+        if system:
+            # Byte-identical between calls, so Gemini's implicit prefix cache can serve it
+            payload["systemInstruction"] = {"parts": [{"text": system}]}
 
         try:
             print(f" Trying Gemini model: {model_name}")
-            resp = requests.post(url, headers=headers, json=payload, timeout=60)
+            with scheduler.slot("llm", "gemini"), metrics.stage("llm", model=model_name):
+                resp = requests.post(url, headers=headers, json=payload, timeout=60)
             
             if resp.status_code == 200:
                 data = resp.json()
@@ -140,7 +138,7 @@ def list_available_models():
     if not GOOGLE_API_KEY:
         return []
     
-    url = f"https://generativelanguage.googleapis.com/v1beta/models?key={GOOGLE_API_KEY}"
+    url = f"{GEMINI_API_BASE}/v1beta/models?key={GOOGLE_API_KEY}"
     try:
         resp = requests.get(url, timeout=30)
         if resp.status_code == 200:
@@ -189,6 +187,7 @@ Guidelines:
 - Keep each suggestion under 15 words.
 - Ensure valid JSON (no markdown, no comments).
 """
+FEEDBACK_SYSTEM = PROMPT_TEMPLATE.strip()
 
 
 
@@ -198,17 +197,17 @@ def gemini_feedback_json(transcript: str, emotion: str, conf: float, file_name:
         print(" Gemini feedback skipped (no API key).")
         return None
 
+    # PROMPT_TEMPLATE is the fixed instruction block; it goes out as the system
+    # instruction so every request shares the same cacheable prefix
     prompt = f"""
-    {PROMPT_TEMPLATE}
-
     DetectedEmotion: {emotion} (confidence {conf:.2f})
 
     Transcript:
-    \"\"\"{transcript[:8000]}\"\"\"
+    \"\"\"{transcript}\"\"\"
     """
 
     print("ℹ Calling Gemini via REST...")
-    text = gemini_generate(prompt)
+    text = gemini_generate(prompt, system=FEEDBACK_SYSTEM)
     if not text:
         raise HTTPException(status_code=500, detail="Empty response from Gemini REST API.")
 
@@ -236,15 +235,27 @@ def gemini_feedback_json(transcript: str, emotion: str, conf: float, file_name:
 
 
 
+def fs_set(ref, data: dict):
+    with metrics.stage("firestore", op="set"):
+        ref.set(data)
+
+
+def fs_update(ref, data: dict):
+    with metrics.stage("firestore", op="update"):
+        ref.update(data)
+
+
 def save_report(uid: str, payload: dict):
+    db = get_db()
     if not db:
         return None
-    ref = (
-        db.collection("users")
-        .document(uid)
-        .collection("interviews")
-        .add({**payload, "createdAt": firestore.SERVER_TIMESTAMP})
-    )
+    with metrics.stage("firestore", op="add"):
+        ref = (
+            db.collection("users")
+            .document(uid)
+            .collection("interviews")
+            .add({**payload, "createdAt": server_timestamp()})
+        )
     return ref[1].id
 
 
@@ -261,101 +272,149 @@ async def debug_models():
 
 
 
+# ========= ANALYSIS PIPELINE =========
+def _run_analysis(interview_ref, raw_path: str, wav_path: str, file_name: str, trace_id: str):
+    """Convert → Whisper → Emotion → Gemini for one upload, updating Firestore as it goes."""
+    # Convert + duration
+    to_wav(raw_path, wav_path)
+    duration = probe_duration(raw_path) or probe_duration(wav_path)
+
+    fs_update(interview_ref, {"status": "processing", "duration": duration})
+
+    # 1️⃣ Transcription
+    transcript = whisper_transcribe(wav_path)
+    fs_update(interview_ref, {
+        "status": "transcribed",
+        "transcript": transcript[:5000]
+    })
+
+    # 2️⃣ Emotion
+    dominant_emotion, confidence, all_emotions = detect_emotion(wav_path)
+    fs_update(interview_ref, {
+        "status": "emotion_detected",
+        "dominantEmotion": dominant_emotion,
+        "emotionConfidence": round(confidence, 3),
+        "allEmotions": all_emotions
+    })
+
+    # 3️⃣ Gemini feedback (long transcripts are compacted first)
+    prompt_transcript, compaction = compact_transcript(transcript, gemini_generate, FEEDBACK_TRANSCRIPT_TOKENS)
+    feedback = gemini_feedback_json(prompt_transcript, dominant_emotion, confidence, file_name, duration)
+    timings = metrics.trace_timings(trace_id)
+
+    # 🔥 Final Firestore update
+    final_result = {
+        "status": "completed",
+        "fileName": file_name,
+        "duration": duration,
+        "transcript": transcript,
+        "dominantEmotion": dominant_emotion,
+        "emotionConfidence": round(confidence, 3),
+        "allEmotions": all_emotions,
+        "feedback": feedback,
+        "compaction": compaction,
+        "traceId": trace_id,
+        "timings": timings,
+    }
+    fs_update(interview_ref, final_result)
+
+
+
+def _mark_failed(interview_ref, error: Exception):
+    """Don't leave a live-updated interview doc stuck in an intermediate status."""
+    if interview_ref is None:
+        return
+    detail = error.detail if isinstance(error, HTTPException) else str(error)
+    try:
+        fs_update(interview_ref, {"status": "failed", "error": str(detail)})
+    except Exception as e:
+        print(f"❌ Could not mark {interview_ref.id} as failed: {e}")
+
+
 # ========= MAIN ANALYZE ROUTE =========
 @router.post("/analyze")
 async def analyze_interview(
-    background: BackgroundTasks,
     file: UploadFile = File(...),
-    user_id: str = Form(default="demo-user")
+    user_id: str = Form(default="demo-user"),
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key"),
 ):
     """
     Upload → Convert → Whisper → Emotion → Gemini → Firestore
     Returns structured JSON for UI + live Firestore updates.
+    Retries with the same Idempotency-Key (or the same file for the same user,
+    shortly after) attach to the original job instead of running the pipeline
+    again. Admission happens after that lookup, so waiting retries hold no job slot.
     """
+    entry, owner, admitted = None, False, False
+    raw_path = wav_path = interview_ref = None
     try:
-        os.makedirs("uploads", exist_ok=True)
+        trace_id = metrics.current_trace_id() or metrics.new_trace()
+        with metrics.stage("upload"):
+            content = await file.read()
+
+        key = idempotency.make_key("analyze", user_id, idempotency_key, content)
+        ttl = None if idempotency_key else idempotency.IDEMPOTENCY_CONTENT_TTL_S
+        while not owner:
+            entry, owner = idempotency.store.begin(key, ttl)
+            if not owner:
+                # Wait off the event loop for the original submission to finish
+                finished = await run_in_threadpool(entry.done.wait, idempotency.IDEMPOTENCY_WAIT_S)
+                if not finished:
+                    return JSONResponse({**entry.meta, "status": "processing", "deduplicated": True}, status_code=202)
+                if entry.result is not None:
+                    return {**entry.result, "deduplicated": True}
+                # original failed and was forgotten: run it ourselves
+
+        scheduler.admit(user_id, ANALYZE_RESOURCES)
+        admitted = True
         with tempfile.NamedTemporaryFile(delete=False, suffix=f"_{file.filename}") as tmp:
             raw_path = tmp.name
-            tmp.write(await file.read())
+            tmp.write(content)
+        del content
         wav_path = raw_path + ".wav"
 
         # 🔥 Create Firestore doc early for live updates
+        db = get_db()
         if not db:
             raise HTTPException(status_code=500, detail="Firestore not initialized.")
         user_ref = db.collection("users").document(user_id)
         interview_ref = user_ref.collection("interviews").document()
-        interview_ref.set({
+        fs_set(interview_ref, {
             "fileName": file.filename,
             "status": "uploading",
-            "createdAt": firestore.SERVER_TIMESTAMP
+            "traceId": trace_id,
+            "createdAt": server_timestamp()
         })
         interview_id = interview_ref.id
+        entry.meta = {"interviewId": interview_id, "userId": user_id, "traceId": trace_id}
         print(f"📄 Firestore doc created: {interview_id}")
 
-        # Convert + duration
-        to_wav(raw_path, wav_path)
-        duration = probe_duration(raw_path) or probe_duration(wav_path)
-
-        interview_ref.update({"status": "processing", "duration": duration})
-
-        # 1️⃣ Transcription
-        t0 = time.time()
-        transcript = whisper_transcribe(wav_path)
-        interview_ref.update({
-            "status": "transcribed",
-            "transcript": transcript[:5000]
-        })
-        print(f"Whisper: {time.time()-t0:.2f}s")
-
-        # 2️⃣ Emotion
-        t0 = time.time()
-        dominant_emotion, confidence, all_emotions = detect_emotion(wav_path)
-        interview_ref.update({
-            "status": "emotion_detected",
-            "dominantEmotion": dominant_emotion,
-            "emotionConfidence": round(confidence, 3),
-            "allEmotions": all_emotions
-        })
-        print(f"Emotion: {time.time()-t0:.2f}s")
-
-        # 3️⃣ Gemini feedback
-        t0 = time.time()
-        feedback = gemini_feedback_json(transcript, dominant_emotion, confidence, file.filename, duration)
-        print(f"Gemini: {time.time()-t0:.2f}s")
-
-        # 🔥 Final Firestore update
-        final_result = {
-            "status": "completed",
-            "fileName": file.filename,
-            "duration": duration,
-            "transcript": transcript,
-            "dominantEmotion": dominant_emotion,
-            "emotionConfidence": round(confidence, 3),
-            "allEmotions": all_emotions,
-            "feedback": feedback,
-        }
-        interview_ref.update(final_result)
+        # Heavy, blocking stages run in the threadpool (the scheduler's waits are thread-based)
+        await run_in_threadpool(_run_analysis, interview_ref, raw_path, wav_path, file.filename, trace_id)
         print("✅ Firestore updated with final data.")
 
-        # Cleanup
-        def _cleanup():
-            for p in (raw_path, wav_path):
-                try:
-                    if os.path.exists(p):
-                        os.remove(p)
-                except Exception:
-                    pass
-        background.add_task(_cleanup)
-
-        return {
+        response = {
             "message": "success",
             "interviewId": interview_id,
             "userId": user_id,
+            "traceId": trace_id,
             "status": "completed"
         }
+        idempotency.store.complete(entry, response)
+        return response
 
-    except HTTPException:
+    except (HTTPException, Overloaded) as e:
+        _mark_failed(interview_ref, e)
         raise
     except Exception as e:
         print(f"❌ UNHANDLED EXCEPTION in /analyze: {e}")
+        _mark_failed(interview_ref, e)
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Any exit without a result (errors, 429, client cancellation) frees the key
+        if owner and not entry.done.is_set():
+            idempotency.store.fail(entry)
+        if admitted:
+            scheduler.finish(user_id)
+        # Temp files go on every exit path, including failures
+        storage.discard(raw_path, wav_path)
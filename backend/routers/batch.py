@@ -0,0 +1,353 @@
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
+from typing import List, Optional
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+from routers.analyze import (
+    to_wav,
+    probe_duration,
+    whisper_transcribe,
+    detect_emotion,
+    gemini_generate,
+    gemini_feedback_json,
+    fs_set,
+    fs_update,
+    FEEDBACK_TRANSCRIPT_TOKENS,
+)
+from routers.upload import UPLOAD_DIR
+from services import metrics, scheduler, storage
+from services.firestore_client import get_db, server_timestamp
+from services.transcript_compactor import compact_transcript
+
+router = APIRouter(tags=["Batch"])
+
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "50"))
+BATCH_RESOURCES = ("cpu", "asr", "llm")
+
+
+def _stage_workers():
+    # e.g. BATCH_STAGE_WORKERS="ffmpeg=2,asr=4,emotion=1,llm=4"
+    workers = {"ffmpeg": 2, "asr": 4, "emotion": 1, "llm": 4}
+    for part in filter(None, os.getenv("BATCH_STAGE_WORKERS", "").split(",")):
+        name, _, n = part.partition("=")
+        workers[name.strip()] = max(1, int(n))
+    return workers
+
+
+# ========= STAGES (run in the threadpool, one job dict per file) =========
+def _convert(job):
+    to_wav(job["raw"], job["wav"])
+    job["duration"] = probe_duration(job["raw"]) or probe_duration(job["wav"])
+    job["audioSeconds"] = max(0.0, (os.path.getsize(job["wav"]) - 44) / 32000.0)
+    fs_update(job["ref"], {"status": "processing", "duration": job["duration"]})
+
+
+def _asr(job):
+    job["transcript"] = whisper_transcribe(job["wav"])
+    fs_update(job["ref"], {"status": "transcribed", "transcript": job["transcript"][:5000]})
+
+
+def _emotion(job):
+    job["emotion"], job["confidence"], job["allEmotions"] = detect_emotion(job["wav"])
+    fs_update(job["ref"], {
+        "status": "emotion_detected",
+        "dominantEmotion": job["emotion"],
+        "emotionConfidence": round(job["confidence"], 3),
+        "allEmotions": job["allEmotions"],
+    })
+
+
+def _llm(job):
+    prompt_transcript, compaction = compact_transcript(job["transcript"], gemini_generate, FEEDBACK_TRANSCRIPT_TOKENS)
+    feedback = gemini_feedback_json(prompt_transcript, job["emotion"], job["confidence"], job["fileName"], job["duration"])
+    fs_update(job["ref"], {
+        "status": "completed",
+        "fileName": job["fileName"],
+        "duration": job["duration"],
+        "transcript": job["transcript"],
+        "dominantEmotion": job["emotion"],
+        "emotionConfidence": round(job["confidence"], 3),
+        "allEmotions": job["allEmotions"],
+        "feedback": feedback,
+        "compaction": compaction,
+        "traceId": job["traceId"],
+        "timings": metrics.trace_timings(job["traceId"]),
+    })
+
+
+STAGES = [("ffmpeg", _convert), ("asr", _asr), ("emotion", _emotion), ("llm", _llm)]
+
+
+def _run_stage(fn, job):
+    # Each file keeps its own trace even though the stages share worker tasks
+    metrics.new_trace(job["traceId"])
+    scheduler.set_user(job["userId"], admitted=True)
+    with job["lock"]:
+        if job["abandoned"]:
+            return  # the stream went away before this stage started
+        job["running"] = True
+    try:
+        fn(job)
+        if fn is STAGES[-1][1]:
+            job["finished"] = True
+    finally:
+        with job["lock"]:
+            job["running"] = False
+            abandoned = job["abandoned"]
+        if abandoned:
+            _abandon(job, abandoned)  # the stream couldn't while this stage held the files
+
+
+def _abandon(job, outcome):
+    """The stream ended early: free the job's files and don't leave it 'queued'."""
+    _cleanup(job)
+    if "error" in job:
+        update = {"status": "failed", "error": job["error"], "failedStage": job["failedStage"]}
+    elif job.get("finished"):
+        return
+    else:
+        update = {"status": outcome, "error": f"Batch {outcome} before this file finished."}
+    try:
+        fs_update(job["ref"], update)
+    except Exception as e:
+        print(f"❌ Could not mark {job['fileName']} as {update['status']}: {e}")
+
+
+def _spool(upload):
+    with tempfile.NamedTemporaryFile(delete=False, suffix=f"_{upload.filename}") as tmp:
+        try:
+            shutil.copyfileobj(upload.file, tmp, 1024 * 1024)
+        except BaseException:
+            storage.discard(tmp.name)
+            raise
+    return tmp.name
+
+
+def _cleanup(job):
+    storage.discard(job["wav"], job["raw"] if job["ownsRaw"] else None)
+
+
+def _resolve_manifest(manifest: str):
+    """Manifest = JSON list of filenames returned by POST /upload/ (or {"filename": ...} objects)."""
+    try:
+        entries = json.loads(manifest)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid manifest JSON: {e}")
+    if not isinstance(entries, list):
+        raise HTTPException(status_code=400, detail="Manifest must be a JSON list.")
+    root = os.path.realpath(UPLOAD_DIR)
+    out = []
+    for entry in entries:
+        name = entry.get("filename") if isinstance(entry, dict) else entry
+        path = os.path.realpath(os.path.join(root, str(name)))
+        if os.path.dirname(path) != root or not os.path.isfile(path):
+            raise HTTPException(status_code=400, detail=f"Unknown upload in manifest: {name}")
+        out.append((os.path.basename(path), path))
+    return out
+
+
+# ========= BATCH ROUTE =========
+@router.post("/analyze/batch")
+async def analyze_batch(
+    files: Optional[List[UploadFile]] = File(default=None),
+    manifest: Optional[str] = Form(default=None),
+    user_id: str = Form(default="demo-user"),
+):
+    """
+    Analyze many recordings at once. Files are pipelined through
+    ffmpeg → Whisper → emotion → Gemini, so different files occupy different
+    stages at the same time. Streams one NDJSON line per file as it finishes,
+    then a summary line with batch totals.
+    """
+    # Admission is held for the whole stream, not via a yield dependency: those
+    # are torn down before a StreamingResponse body runs
+    scheduler.admit(user_id, BATCH_RESOURCES)
+    released = False
+
+    def release():
+        nonlocal released
+        if not released:
+            released = True
+            scheduler.finish(user_id)
+
+    try:
+        return await _start_batch(files, manifest, user_id, release)
+    except BaseException:
+        release()
+        raise
+
+
+async def _start_batch(files, manifest, user_id, release):
+    db = get_db()
+    if not db:
+        raise HTTPException(status_code=500, detail="Firestore not initialized.")
+
+    sources = _resolve_manifest(manifest) if manifest else []
+    if len(sources) + len(files or []) == 0:
+        raise HTTPException(status_code=400, detail="Provide files or a manifest.")
+    if len(sources) + len(files or []) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_FILES} files per batch.")
+
+    batch_id = uuid.uuid4().hex
+    user_ref = db.collection("users").document(user_id)
+    batch_ref = user_ref.collection("batches").document(batch_id)
+
+    # Uploads must be spooled to disk here: the request body is gone once streaming starts
+    jobs = []
+    try:
+        with metrics.stage("upload"):
+            for f in files or []:
+                jobs.append({"fileName": f.filename, "raw": await run_in_threadpool(_spool, f), "ownsRaw": True})
+    except BaseException:
+        storage.discard(*(job["raw"] for job in jobs))
+        raise
+    for name, path in sources:
+        jobs.append({"fileName": name, "raw": path, "ownsRaw": False})
+
+    for i, job in enumerate(jobs):
+        job.update({"index": i, "userId": user_id, "wav": f"{job['raw']}.{batch_id}.wav", "traceId": uuid.uuid4().hex,
+                    "lock": threading.Lock(), "running": False, "abandoned": None})
+        metrics.new_trace(job["traceId"])
+        job["ref"] = user_ref.collection("interviews").document()
+        fs_set(job["ref"], {
+            "fileName": job["fileName"],
+            "status": "queued",
+            "batchId": batch_id,
+            "traceId": job["traceId"],
+            "createdAt": server_timestamp(),
+        })
+    fs_set(batch_ref, {"status": "running", "total": len(jobs), "createdAt": server_timestamp()})
+
+    streaming = False
+
+    async def stream():
+        nonlocal streaming
+        streaming = True
+        workers = _stage_workers()
+        queues = [asyncio.Queue() for _ in STAGES]
+        done = asyncio.Queue()
+        started = time.perf_counter()
+
+        async def stage_worker(idx, name, fn):
+            while True:
+                job = await queues[idx].get()
+                metrics.add_gauge("batch_queue_depth", -1, stage=name)
+                try:
+                    await run_in_threadpool(_run_stage, fn, job)
+                except Exception as e:
+                    job["error"] = getattr(e, "detail", None) or str(e)
+                    job["failedStage"] = name
+                if job["abandoned"]:
+                    continue  # the stream is gone and _run_stage has cleaned up
+                if "error" in job or idx + 1 == len(STAGES):
+                    job["finished"] = True
+                    await done.put(job)
+                else:
+                    metrics.add_gauge("batch_queue_depth", 1, stage=STAGES[idx + 1][0])
+                    await queues[idx + 1].put(job)
+
+        tasks = [
+            asyncio.create_task(stage_worker(i, name, fn))
+            for i, (name, fn) in enumerate(STAGES)
+            for _ in range(workers.get(name, 1))
+        ]
+        for job in jobs:
+            job["startedAt"] = time.perf_counter()
+            metrics.add_gauge("batch_queue_depth", 1, stage=STAGES[0][0])
+            await queues[0].put(job)
+
+        completed = failed = 0
+        audio_seconds = 0.0
+        outcome = None
+        try:
+            for _ in jobs:
+                job = await done.get()
+                job["reported"] = True
+                _cleanup(job)
+                line = {
+                    "type": "result",
+                    "index": job["index"],
+                    "fileName": job["fileName"],
+                    "interviewId": job["ref"].id,
+                    "traceId": job["traceId"],
+                    "seconds": round(time.perf_counter() - job["startedAt"], 3),
+                }
+                if "error" in job:
+                    failed += 1
+                    line.update({"status": "failed", "stage": job["failedStage"], "error": job["error"]})
+                    metrics.inc("batch_files_total", status="failed")
+                    try:
+                        fs_update(job["ref"], {"status": "failed", "error": job["error"], "failedStage": job["failedStage"]})
+                    except Exception as e:
+                        print(f"❌ Could not mark {job['fileName']} as failed: {e}")
+                else:
+                    completed += 1
+                    audio_seconds += job.get("audioSeconds", 0.0)
+                    line["status"] = "completed"
+                    metrics.inc("batch_files_total", status="completed")
+                yield json.dumps(line) + "\n"
+
+            wall = time.perf_counter() - started
+            totals = {
+                "status": "completed",
+                "total": len(jobs),
+                "completed": completed,
+                "failed": failed,
+                "wallSeconds": round(wall, 3),
+                "filesPerMinute": round(60 * len(jobs) / wall, 2) if wall else None,
+                "audioSecondsProcessed": round(audio_seconds, 1),
+                "realtimeFactor": round(audio_seconds / wall, 2) if wall else None,
+                "stageWorkers": workers,
+            }
+            fs_update(batch_ref, totals)
+            yield json.dumps({"type": "summary", "batchId": batch_id, **totals}) + "\n"
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "cancelled"  # client disconnected
+            raise
+        except Exception:
+            outcome = "failed"
+            raise
+        finally:
+            for t in tasks:
+                t.cancel()
+            for idx, (name, _) in enumerate(STAGES):
+                metrics.add_gauge("batch_queue_depth", -queues[idx].qsize(), stage=name)
+            if outcome:
+                # Jobs still inside a stage are cleaned up by _run_stage when it returns
+                for job in jobs:
+                    if job.get("reported"):
+                        continue
+                    with job["lock"]:
+                        job["abandoned"] = outcome
+                        running = job["running"]
+                    if not running:
+                        _abandon(job, outcome)
+                try:
+                    fs_update(batch_ref, {"status": outcome, "completed": completed, "failed": failed})
+                except Exception as e:
+                    print(f"❌ Could not mark batch {batch_id} as {outcome}: {e}")
+            release()
+
+    def finish_unstarted():
+        # Runs after the response. If the client left before the body started,
+        # stream() (and its finally) never ran: release admission and the jobs here
+        if not streaming:
+            for job in jobs:
+                _abandon(job, "cancelled")
+            try:
+                fs_update(batch_ref, {"status": "cancelled", "completed": 0, "failed": 0})
+            except Exception as e:
+                print(f"❌ Could not mark batch {batch_id} as cancelled: {e}")
+        release()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson", headers={"X-Batch-Id": batch_id},
+                             background=BackgroundTask(finish_unstarted))
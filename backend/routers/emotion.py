@@ -1,57 +1,60 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from transformers import pipeline
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 import os
+import shutil
+import tempfile
 import ffmpeg
 
+from services import metrics, scheduler, storage
+from services.scheduler import Overloaded
+from services.emotion_models import get_audio_model
+
 # Initialize FastAPI router
 router = APIRouter()
 
-# Load Hugging Face emotion model
-try:
-    print(" Loading emotion detection model...")
-    emotion_model = pipeline(
-        "audio-classification",
-        model="r-f/wav2vec-english-speech-emotion-recognition"
-    )
-    print(" Emotion model loaded successfully.")
-except Exception as e:
-    print(f" Failed to load emotion model: {e}")
-    raise e
+
+def _classify(temp_path: str, wav_path: str):
+    #  Convert to WAV (works for .mp4, .m4a, etc.)
+    with metrics.stage("ffmpeg"):
+        ffmpeg.input(temp_path).output(
+            wav_path, format="wav", ac=1, ar="16000"
+        ).run(quiet=True, overwrite_output=True)
+
+    #  Run emotion model
+    with scheduler.slot("cpu"), metrics.stage("emotion"):
+        return get_audio_model()(wav_path)
 
 
 @router.post("/emotion")
-async def analyze_emotion(file: UploadFile = File(...)):
+async def analyze_emotion(
+    file: UploadFile = File(...),
+    _user: str = Depends(scheduler.admission(("cpu",))),
+):
     """
     Analyze emotions in an uploaded audio or video file.
     Automatically converts to WAV and classifies emotion using Hugging Face Wav2Vec2 model.
     """
+    temp_path = wav_path = None
     try:
-        os.makedirs("uploads", exist_ok=True)
-        temp_path = f"uploads/{file.filename}"
-        wav_path = temp_path.rsplit(".", 1)[0] + ".wav"
-
-        # Save the uploaded file
-        with open(temp_path, "wb") as f:
-            f.write(await file.read())
-
-        #  Convert to WAV (works for .mp4, .m4a, etc.)
-        ffmpeg.input(temp_path).output(
-            wav_path, format="wav", ac=1, ar="16000"
-        ).run(quiet=True, overwrite_output=True)
-
-        #  Run emotion model
-        results = emotion_model(wav_path)
+        # Spool outside uploads/ under a unique name; removed on every exit path
+        suffix = os.path.splitext(file.filename or "")[1]
+        with metrics.stage("upload"), tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as f:
+            temp_path = f.name
+            shutil.copyfileobj(file.file, f, 1024 * 1024)
+        wav_path = temp_path + ".wav"
+
+        results = await run_in_threadpool(_classify, temp_path, wav_path)
         top_result = results[0]
 
-        #  Clean up
-        os.remove(temp_path)
-        os.remove(wav_path)
-
         return {
             "emotion": top_result["label"],
             "confidence": round(top_result["score"], 3),
             "all_predictions": results
         }
 
+    except Overloaded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        storage.discard(temp_path, wav_path)
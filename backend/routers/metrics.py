@@ -0,0 +1,51 @@
+import os
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from services import metrics, emotion_models, storage
+
+router = APIRouter(tags=["Metrics"])
+
+
+def _memory_report():
+    report = {"worker": {"pid": os.getpid(), "rss": metrics.rss_bytes()}, "backend": emotion_models.EMOTION_BACKEND}
+    if emotion_models.EMOTION_BACKEND == "server":
+        from services import inference_server
+        try:
+            report["inferenceServer"] = inference_server.stats()
+        except Exception as e:
+            report["inferenceServer"] = {"error": str(e)}
+    return report
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Stage latency histograms, queue depths, cache hit rates and model-load times."""
+    server = _memory_report().get("inferenceServer") or {}
+    if "rss" in server:
+        metrics.set_gauge("inference_server_resident_memory_bytes", server["rss"], pid=server["pid"])
+        for pid, w in server.get("workers", {}).items():
+            metrics.set_gauge("worker_resident_memory_bytes", w["rss"], pid=pid)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/debug/memory")
+def memory():
+    """RSS of this worker and, in EMOTION_BACKEND=server mode, of the inference process and every worker it has seen."""
+    return _memory_report()
+
+
+@router.get("/debug/storage")
+def storage_usage():
+    """Disk usage under uploads/ by owner, quotas and the archival backlog."""
+    return storage.manager.usage()
+
+
+@router.get("/debug/traces/{trace_id}")
+def get_trace(trace_id: str):
+    """Per-stage breakdown of a single job, looked up by its X-Trace-Id."""
+    trace = metrics.get_trace(trace_id)
+    if not trace:
+        raise HTTPException(status_code=404, detail="Trace not found (expired or unknown).")
+    return {**trace, "totals": metrics.trace_timings(trace_id)}
@@ -1,10 +1,32 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 import os
-from openai import OpenAI
+import shutil
+import tempfile
+
+from services import metrics, scheduler, storage
+from services.scheduler import Overloaded
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+_client = None
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        from openai import OpenAI
+        _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _client
+
+
+def _whisper(temp_path: str):
+    with scheduler.slot("asr", "whisper"), metrics.stage("asr"), open(temp_path, "rb") as audio:
+        return _get_client().audio.transcriptions.create(
+            model="whisper-1",
+            file=audio
+        )
+
 
 router = APIRouter()
 
@@ -13,21 +35,21 @@ async def transcribe_audio(file: UploadFile = File(...)):
     """
     Transcribe an uploaded audio or video file using OpenAI Whisper API.
     """
+    temp_path = None
     try:
-        # Save temporarily
-        temp_path = f"uploads/{file.filename}"
-        with open(temp_path, "wb") as f:
-            f.write(await file.read())
+        # Save temporarily (unique name outside uploads/, removed on every exit path)
+        suffix = os.path.splitext(file.filename or "")[1]
+        with metrics.stage("upload"), tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as f:
+            temp_path = f.name
+            shutil.copyfileobj(file.file, f, 1024 * 1024)
 
         # Send to OpenAI Whisper
-        with open(temp_path, "rb") as audio:
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio
-            )
-
-        os.remove(temp_path)
+        transcript = await run_in_threadpool(_whisper, temp_path)
         return {"transcript": transcript.text}
 
+    except Overloaded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        storage.discard(temp_path)
@@ -1,7 +1,10 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request
 import os
 import uuid
 
+from services import object_storage, storage
+from services.firebase_service import upload_to_firebase
+
 router = APIRouter(prefix="/upload", tags=["Upload"])
 
 # Create uploads folder if not exists
@@ -26,9 +29,46 @@ async def upload_media(file: UploadFile = File(...)):
 
     with open(file_path, "wb") as f:
         f.write(await file.read())
+    storage.manager.written(file_path)
 
     return {
         "filename": unique_name,
         "path": file_path,
         "message": "File saved locally in /uploads folder."
     }
+
+
+_FILE_FORM = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object", "required": ["file"], "properties": {"file": {"type": "string", "format": "binary"}},
+}}}}}
+
+
+@router.post("/cloud", status_code=202, openapi_extra=_FILE_FORM)
+async def upload_to_cloud(request: Request):
+    """
+    Stream a file to Firebase Storage in parallel chunks. The multipart body is
+    parsed as it arrives (no UploadFile spooling); returns as soon as it has
+    been read. Poll /upload/cloud/{jobId} for the public URL.
+    """
+    try:
+        source = await object_storage.MultipartFileSource(request).start()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if source.content_type not in ALLOWED_TYPES:
+        raise HTTPException(status_code=400,
+            detail=f"Unsupported file type: {source.content_type}. Please upload audio or video only.")
+    try:
+        job = await upload_to_firebase(source, wait=False)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return job.to_dict()
+
+
+@router.get("/cloud/{job_id}")
+def cloud_upload_status(job_id: str):
+    job = object_storage.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Upload job not found (expired or unknown).")
+    return job.to_dict()
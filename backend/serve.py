@@ -0,0 +1,50 @@
+"""Multi-worker entrypoint.
+
+    EMOTION_BACKEND=server python serve.py --workers 4
+
+With EMOTION_BACKEND=server the emotion models are loaded once, in a dedicated
+inference process started here, and every uvicorn worker sends PCM to it through
+shared memory. Otherwise this is equivalent to `uvicorn main:app --workers N`.
+"""
+import argparse
+import os
+import secrets
+import subprocess
+import sys
+import tempfile
+
+import uvicorn
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--app", default="main:app")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    ap.add_argument("--log-level", default="info")
+    args = ap.parse_args()
+
+    inference = None
+    if os.getenv("EMOTION_BACKEND", "local") == "server":
+        # Fresh secret and private socket directory per run; the inference process
+        # and the uvicorn workers inherit both through the environment
+        os.environ.setdefault("INFERENCE_AUTHKEY", secrets.token_hex(32))
+        if not os.getenv("INFERENCE_ADDRESS"):
+            os.environ["INFERENCE_ADDRESS"] = os.path.join(tempfile.mkdtemp(prefix="interview-analyzer-"), "inference.sock")
+        from services import inference_server
+
+        inference = subprocess.Popen([sys.executable, "-m", "services.inference_server"])
+        if not inference_server.ping(timeout=600):
+            inference.terminate()
+            sys.exit("Inference server failed to start")
+    try:
+        uvicorn.run(args.app, host=args.host, port=args.port, workers=args.workers, log_level=args.log_level)
+    finally:
+        if inference:
+            inference.terminate()
+            inference.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,14 @@
-from transformers import pipeline
-
-emotion_model = pipeline(
-    "text-classification",
-    model="j-hartmann/emotion-english-distilroberta-base",
-    return_all_scores=False
-)
+from services.emotion_fusion import classify_sentences, split_sentences, LABELS
 
 def analyze_emotion(text: str):
-    result = emotion_model(text[:512])  # limit to 512 tokens
-    return result[0]
+    """Text-only emotion of a whole transcript: sentences classified in batches, weighted by length."""
+    sentences = split_sentences(text or "")
+    dists = classify_sentences(sentences)
+    total = [0.0] * len(LABELS)
+    for sentence, dist in zip(sentences, dists):
+        if dist is not None:
+            total = [t + len(sentence) * p for t, p in zip(total, dist)]
+    if not any(total):
+        return {"label": "neutral", "score": 0.0}
+    best = max(range(len(LABELS)), key=total.__getitem__)
+    return {"label": LABELS[best], "score": total[best] / sum(total)}
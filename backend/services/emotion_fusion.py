@@ -0,0 +1,185 @@
+import os
+import re
+import wave
+
+import numpy as np
+
+from services import metrics, scheduler
+from services.emotion_models import get_audio_model, get_text_model
+
+# Text + audio emotion fusion for a spoken answer.
+# The whole transcript is split into sentences and classified in batches by the
+# distilroberta text model (duplicate sentences are classified once). The audio
+# is cut into fixed windows and scored by the wav2vec model. Whisper returns no
+# timestamps here, so each sentence is placed on the timeline proportionally to
+# its character offset and takes the audio distribution of the windows it
+# overlaps. Both distributions are mapped onto a shared label set and mixed.
+FUSION_TEXT_WEIGHT = float(os.getenv("FUSION_TEXT_WEIGHT", "0.5"))
+FUSION_WINDOW_S = float(os.getenv("FUSION_WINDOW_S", "4"))
+FUSION_MAX_WINDOWS = int(os.getenv("FUSION_MAX_WINDOWS", "30"))
+TEXT_BATCH_SIZE = int(os.getenv("EMOTION_TEXT_BATCH", "16"))
+TEXT_MAX_CHARS = 1000  # the model truncates at 512 tokens; very long "sentences" are split first
+
+LABELS = ["anger", "disgust", "fear", "joy", "neutral", "sadness", "surprise"]
+_ALIASES = {
+    "ang": "anger", "angry": "anger",
+    "dis": "disgust", "disgusted": "disgust",
+    "fea": "fear", "fearful": "fear",
+    "hap": "joy", "happy": "joy", "happiness": "joy",
+    "neu": "neutral", "calm": "neutral",
+    "sad": "sadness",
+    "sur": "surprise", "surprised": "surprise", "ps": "surprise",
+}
+
+
+def _canonical(label: str) -> str:
+    label = label.lower()
+    return label if label in LABELS else _ALIASES.get(label)
+
+
+def _distribution(scores):
+    """[{label, score}] -> normalized vector over LABELS (unknown labels dropped)."""
+    vec = np.zeros(len(LABELS))
+    for s in scores:
+        label = _canonical(s["label"])
+        if label:
+            vec[LABELS.index(label)] += float(s["score"])
+    total = vec.sum()
+    return vec / total if total > 0 else None
+
+
+def _summary(vec):
+    if vec is None:
+        return None
+    i = int(np.argmax(vec))
+    return {"label": LABELS[i], "confidence": round(float(vec[i]), 3)}
+
+
+# ========= TEXT =========
+def split_sentences(text: str):
+    sentences = []
+    for s in re.split(r"(?<=[.!?])\s+|\n+", text.strip()):
+        s = s.strip()
+        while len(s) > TEXT_MAX_CHARS:
+            sentences.append(s[:TEXT_MAX_CHARS])
+            s = s[TEXT_MAX_CHARS:]
+        if s:
+            sentences.append(s)
+    return sentences
+
+
+def classify_sentences(sentences):
+    """Batched text classification; returns one distribution per sentence."""
+    unique = sorted(set(sentences), key=len)  # similar lengths per batch → less padding
+    if not unique:
+        return []
+    with metrics.stage("emotion", modality="text"):
+        results = get_text_model()(unique, batch_size=TEXT_BATCH_SIZE, top_k=None, truncation=True)
+    metrics.inc("emotion_text_sentences_total", len(sentences))
+    metrics.inc("emotion_text_sentences_deduplicated_total", len(sentences) - len(unique))
+    by_text = {s: _distribution(r if isinstance(r, list) else [r]) for s, r in zip(unique, results)}
+    return [by_text[s] for s in sentences]
+
+
+# ========= AUDIO =========
+def _read_pcm(wav_path: str):
+    with wave.open(wav_path, "rb") as w:
+        if w.getsampwidth() != 2 or w.getnchannels() != 1:
+            raise ValueError("Expected 16-bit mono WAV (see to_wav)")
+        sr = w.getframerate()
+        raw = w.readframes(w.getnframes())
+    return np.frombuffer(raw, dtype=np.int16).astype(np.float32) / 32768.0, sr
+
+
+def classify_windows(wav_path: str):
+    """Return (window_seconds, [distribution per window], total_seconds)."""
+    pcm, sr = _read_pcm(wav_path)
+    total = pcm.size / sr
+    if not pcm.size:
+        return FUSION_WINDOW_S, [], 0.0
+    window = max(FUSION_WINDOW_S, total / FUSION_MAX_WINDOWS)
+    step = int(window * sr)
+    model = get_audio_model()
+    dists = []
+    with metrics.stage("emotion", modality="audio"):
+        for start in range(0, pcm.size, step):
+            chunk = pcm[start:start + step]
+            if chunk.size < sr // 2 and dists:
+                break  # fold a sub-second tail into the previous window's estimate
+            dists.append(_distribution(model({"raw": chunk, "sampling_rate": sr}, top_k=len(LABELS) + 3)))
+    return window, dists, total
+
+
+def _audio_for_span(windows, window_s, start, end):
+    """Overlap-weighted mean of the window distributions covering [start, end)."""
+    acc, weight = np.zeros(len(LABELS)), 0.0
+    for i, dist in enumerate(windows):
+        overlap = min(end, (i + 1) * window_s) - max(start, i * window_s)
+        if dist is not None and overlap > 0:
+            acc += overlap * dist
+            weight += overlap
+    return acc / weight if weight else None
+
+
+def _mix(text_vec, audio_vec, text_weight=FUSION_TEXT_WEIGHT):
+    if text_vec is None:
+        return audio_vec
+    if audio_vec is None:
+        return text_vec
+    return text_weight * text_vec + (1 - text_weight) * audio_vec
+
+
+# ========= FUSION =========
+def fuse_answer(wav_path: str, transcript: str):
+    """
+    Fused emotion for one recorded answer:
+    {label, confidence, text, audio, distribution, sentences: [{text, start, end, label, confidence}]}
+    """
+    sentences = split_sentences(transcript or "")
+    with scheduler.slot("cpu"):
+        window_s, windows, total = classify_windows(wav_path)
+        text_dists = classify_sentences(sentences)
+
+    chars = sum(len(s) for s in sentences) or 1
+    offset = 0
+    per_sentence = []
+    fused_acc, text_acc = np.zeros(len(LABELS)), np.zeros(len(LABELS))
+    for sentence, text_vec in zip(sentences, text_dists):
+        start, end = total * offset / chars, total * (offset + len(sentence)) / chars
+        offset += len(sentence)
+        fused = _mix(text_vec, _audio_for_span(windows, window_s, start, end))
+        share = len(sentence) / chars  # longer sentences take more of the answer
+        if fused is not None:
+            fused_acc += share * fused
+        if text_vec is not None:
+            text_acc += share * text_vec
+        per_sentence.append({"text": sentence, "start": round(start, 2), "end": round(end, 2), **(_summary(fused) or {})})
+
+    audio_vec = _distribution([{"label": l, "score": v} for d in windows if d is not None for l, v in zip(LABELS, d)])
+    text_vec = text_acc / text_acc.sum() if text_acc.sum() else None
+    fused_vec = fused_acc / fused_acc.sum() if fused_acc.sum() else _mix(text_vec, audio_vec)
+    return {
+        **(_summary(fused_vec) or {"label": "neutral", "confidence": 0.0}),
+        "text": _summary(text_vec),
+        "audio": _summary(audio_vec),
+        "distribution": _as_dict(fused_vec),
+        "sentences": per_sentence,
+        "seconds": round(total, 2),
+    }
+
+
+def _as_dict(vec):
+    return {l: round(float(v), 4) for l, v in zip(LABELS, vec)} if vec is not None else {}
+
+
+def fuse_session(answers):
+    """Duration-weighted combination of fuse_answer() results for a whole session."""
+    acc, weight = np.zeros(len(LABELS)), 0.0
+    for a in answers:
+        if not a or not a.get("distribution"):
+            continue
+        w = max(a.get("seconds") or 0.0, 1.0)
+        acc += w * np.array([a["distribution"][l] for l in LABELS])
+        weight += w
+    vec = acc / weight if weight else None
+    return {**(_summary(vec) or {"label": "neutral", "confidence": 0.0}), "distribution": _as_dict(vec)}
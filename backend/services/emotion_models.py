@@ -0,0 +1,77 @@
+import os
+import threading
+
+from services import metrics
+
+# Emotion pipelines are loaded lazily (first request or startup warm-up) so that
+# importing the app does not pull in transformers/torch.
+#
+# EMOTION_BACKEND=local  — each process loads its own pipelines (default)
+# EMOTION_BACKEND=server — pipelines live in one inference process shared by all
+#                          workers (see services/inference_server.py and serve.py)
+AUDIO_MODEL = "r-f/wav2vec-english-speech-emotion-recognition"
+TEXT_MODEL = "j-hartmann/emotion-english-distilroberta-base"
+EMOTION_BACKEND = os.getenv("EMOTION_BACKEND", "local")
+
+_models = {}
+_locks = {"audio": threading.Lock(), "text": threading.Lock()}
+
+
+def _load(kind: str, label: str, factory):
+    if kind in _models:
+        return _models[kind]
+    with _locks[kind]:
+        if kind not in _models:
+            with metrics.model_load(label):
+                _models[kind] = factory()
+    return _models[kind]
+
+
+def get_local_audio_model():
+    # Runtime (torch / int8 / onnx / onnx-int8) is chosen by EMOTION_RUNTIME
+    from services.emotion_runtime import EMOTION_RUNTIME, build_audio_model
+    return _load("audio", f"{AUDIO_MODEL} [{EMOTION_RUNTIME}]", lambda: build_audio_model(AUDIO_MODEL))
+
+
+def get_local_text_model():
+    def factory():
+        from transformers import pipeline
+        return pipeline("text-classification", model=TEXT_MODEL, return_all_scores=False)
+    return _load("text", TEXT_MODEL, factory)
+
+
+def get_audio_model():
+    """wav2vec speech-emotion pipeline (shared by /analyze, /emotion and practice)."""
+    if EMOTION_BACKEND == "server":
+        from services.inference_server import RemoteAudioModel
+        return RemoteAudioModel()
+    return get_local_audio_model()
+
+
+def get_text_model():
+    """distilroberta text-emotion pipeline."""
+    if EMOTION_BACKEND == "server":
+        from services.inference_server import RemoteTextModel
+        return RemoteTextModel()
+    return get_local_text_model()
+
+
+def warm_local():
+    get_local_audio_model()
+    get_local_text_model()
+
+
+def warm():
+    if EMOTION_BACKEND == "server":
+        from services.inference_server import ping
+        if not ping(timeout=60):
+            raise RuntimeError("Inference server did not respond")
+        return
+    warm_local()
+
+
+def status() -> dict:
+    if EMOTION_BACKEND == "server":
+        from services.inference_server import ping
+        return {"inferenceServer": ping()}
+    return {"audio": "audio" in _models, "text": "text" in _models}
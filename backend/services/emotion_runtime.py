@@ -0,0 +1,139 @@
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+# CPU runtimes for the wav2vec speech-emotion model, selected with EMOTION_RUNTIME:
+#   torch  — fp32 transformers pipeline (default)
+#   int8   — same pipeline with dynamic int8 quantization of the Linear layers
+#   onnx   — exported once to ONNX and run with onnxruntime
+#   onnx-int8 — ONNX export with onnxruntime dynamic int8 quantization
+# Every runtime returns a callable with the pipeline's interface, so analyze.py and
+# emotion.py don't change. EMOTION_THREADS sets the intra-op thread count.
+EMOTION_RUNTIME = os.getenv("EMOTION_RUNTIME", "torch")
+RUNTIMES = ("torch", "int8", "onnx", "onnx-int8")
+EMOTION_THREADS = int(os.getenv("EMOTION_THREADS", "0")) or None
+ONNX_DIR = os.getenv("EMOTION_ONNX_DIR", os.path.join(os.path.dirname(__file__), "..", "data", "onnx"))
+SAMPLE_RATE = 16000
+
+
+def _set_torch_threads():
+    if EMOTION_THREADS:
+        import torch
+        torch.set_num_threads(EMOTION_THREADS)
+
+
+def _softmax(x):
+    e = np.exp(x - x.max())
+    return e / e.sum()
+
+
+class OnnxAudioClassifier:
+    """onnxruntime-backed replacement for the audio-classification pipeline."""
+
+    def __init__(self, session, feature_extractor, id2label):
+        self.session = session
+        self.feature_extractor = feature_extractor
+        self.id2label = id2label
+        self.input_names = {i.name for i in session.get_inputs()}
+
+    def _load_audio(self, inputs):
+        if isinstance(inputs, dict):
+            if inputs.get("sampling_rate", SAMPLE_RATE) != SAMPLE_RATE:
+                raise ValueError(f"Expected {SAMPLE_RATE} Hz audio")
+            return np.asarray(inputs["raw"], dtype=np.float32)
+        if isinstance(inputs, np.ndarray):
+            return inputs.astype(np.float32, copy=False)
+        from transformers.pipelines.audio_utils import ffmpeg_read
+        with open(inputs, "rb") as f:
+            return ffmpeg_read(f.read(), SAMPLE_RATE)
+
+    def __call__(self, inputs, top_k=5, **kwargs):
+        audio = self._load_audio(inputs)
+        feats = self.feature_extractor(audio, sampling_rate=SAMPLE_RATE, return_tensors="np")
+        feed = {k: v for k, v in feats.items() if k in self.input_names}
+        logits = self.session.run(None, feed)[0][0]
+        probs = _softmax(logits.astype(np.float64))
+        order = np.argsort(-probs)[:top_k]
+        return [{"label": self.id2label[int(i)], "score": float(probs[i])} for i in order]
+
+
+@contextmanager
+def _atomic_output(path: str):
+    """
+    Yield a temp path next to `path` and move it into place only once written, so
+    a crash or a concurrent worker never leaves a truncated model behind.
+    """
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.onnx"
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _export_onnx(model_name: str, quantize: bool):
+    from transformers import AutoConfig, AutoFeatureExtractor, AutoModelForAudioClassification
+
+    os.makedirs(ONNX_DIR, exist_ok=True)
+    base = os.path.join(ONNX_DIR, model_name.replace("/", "__"))
+    fp32_path, int8_path = base + ".onnx", base + ".int8.onnx"
+
+    feature_extractor = AutoFeatureExtractor.from_pretrained(model_name)
+    if os.path.exists(fp32_path):
+        id2label = AutoConfig.from_pretrained(model_name).id2label
+    else:
+        import torch
+
+        print(f"📦 Exporting {model_name} to ONNX at {fp32_path}")
+        model = AutoModelForAudioClassification.from_pretrained(model_name, return_dict=False)
+        model.eval()
+        id2label = model.config.id2label
+        dummy = torch.zeros(1, SAMPLE_RATE, dtype=torch.float32)
+        with _atomic_output(fp32_path) as tmp:
+            torch.onnx.export(
+                model, (dummy,), tmp,
+                input_names=["input_values"], output_names=["logits"],
+                dynamic_axes={"input_values": {0: "batch", 1: "samples"}, "logits": {0: "batch"}},
+                opset_version=17,
+            )
+    path = fp32_path
+    if quantize:
+        if not os.path.exists(int8_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            with _atomic_output(int8_path) as tmp:
+                quantize_dynamic(fp32_path, tmp, weight_type=QuantType.QInt8)
+        path = int8_path
+    return path, feature_extractor, id2label
+
+
+def build_audio_model(model_name: str, runtime: str = None):
+    """Return a callable with the audio-classification pipeline interface."""
+    runtime = runtime or EMOTION_RUNTIME
+    if runtime not in RUNTIMES:  # before any model download or load
+        raise ValueError(f"Unknown EMOTION_RUNTIME: {runtime} (expected one of {', '.join(RUNTIMES)})")
+    if runtime in ("onnx", "onnx-int8"):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            print("⚠️ onnxruntime not installed — falling back to the torch runtime.")
+            runtime = "torch"
+        else:
+            path, feature_extractor, id2label = _export_onnx(model_name, quantize=runtime == "onnx-int8")
+            opts = ort.SessionOptions()
+            if EMOTION_THREADS:
+                opts.intra_op_num_threads = EMOTION_THREADS
+            opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+            return OnnxAudioClassifier(session, feature_extractor, id2label)
+
+    from transformers import pipeline
+
+    _set_torch_threads()
+    pipe = pipeline("audio-classification", model=model_name)
+    if runtime == "int8":
+        import torch
+        pipe.model = torch.ao.quantization.quantize_dynamic(pipe.model, {torch.nn.Linear}, dtype=torch.qint8)
+    return pipe
@@ -1,18 +1,21 @@
-import firebase_admin
-from firebase_admin import credentials, storage
-import uuid, os
+import os
+import uuid
 
-cred = credentials.Certificate("firebase-service-account.json")
-firebase_admin.initialize_app(cred, {"storageBucket": "your-project-id.appspot.com"})
-bucket = storage.bucket()
+from fastapi.concurrency import run_in_threadpool
 
-async def upload_to_firebase(file):
-    temp_file = f"temp_{uuid.uuid4()}_{file.filename}"
-    with open(temp_file, "wb") as f:
-        f.write(await file.read())
+from services import object_storage
 
-    blob = bucket.blob(f"uploads/{file.filename}")
-    blob.upload_from_filename(temp_file)
-    blob.make_public()
-    os.remove(temp_file)
-    return blob.public_url
+# Firebase Storage uploads stream straight from the request in chunks (see
+# services/object_storage.py); the app and bucket are initialised on first use.
+
+
+async def upload_to_firebase(file, wait: bool = True):
+    """Upload an UploadFile (or MultipartFileSource) to uploads/<uuid>_<name>; returns the public URL (or the job if wait=False)."""
+    name = f"uploads/{uuid.uuid4()}_{os.path.basename(file.filename or 'upload')}"
+    job = await object_storage.upload_stream(file, name)
+    if not wait:
+        return job
+    await run_in_threadpool(job.done.wait)
+    if job.error:
+        raise RuntimeError(f"Firebase upload failed: {job.error}")
+    return job.url
@@ -0,0 +1,54 @@
+import os
+import threading
+
+# Firestore is initialised on first use (or by the startup warm-up) instead of at
+# import time, so importing the routers stays cheap.
+FIREBASE_CREDENTIALS = os.getenv("FIREBASE_CREDENTIALS", "firebase-service-account.json")
+
+_lock = threading.Lock()
+_db = None
+_initialized = False
+
+
+def get_db():
+    """Return the shared Firestore client, or None if credentials are unavailable."""
+    global _db, _initialized
+    if _initialized:
+        return _db
+    with _lock:
+        if _initialized:
+            return _db
+        abs_path = os.path.abspath(FIREBASE_CREDENTIALS)
+        print(f"🧩 Checking Firestore credentials at: {abs_path}")
+        if os.path.exists(abs_path):
+            try:
+                import firebase_admin
+                from firebase_admin import credentials, firestore
+
+                if not firebase_admin._apps:
+                    firebase_admin.initialize_app(credentials.Certificate(abs_path))
+                _db = firestore.client()
+                print("✅ Firestore initialized successfully.")
+            except Exception as e:
+                print(f"❌ Firestore init failed: {e}")
+        else:
+            print("⚠️ Firestore disabled — credentials file missing or incorrect path.")
+        _initialized = True
+        return _db
+
+
+def set_db(db):
+    """Install a client explicitly (e.g. the in-memory fake used by bench/)."""
+    global _db, _initialized
+    with _lock:
+        _db = db
+        _initialized = True
+
+
+def is_ready() -> bool:
+    return _initialized and _db is not None
+
+
+def server_timestamp():
+    from firebase_admin import firestore
+    return firestore.SERVER_TIMESTAMP
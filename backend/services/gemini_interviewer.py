@@ -1,16 +1,13 @@
 import google.generativeai as genai
-import os, json
+import os
+from services.role_catalog import catalog
 
 # Load Gemini API key
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
 def load_role_template(role: str):
-    path = f"backend/data/role_templates/{role}.json"
-    if not os.path.exists(path):
-        print(f"⚠️  File not found at: {path}")
-        return {"title": role}
-    with open(path) as f:
-        return json.load(f)
+    # Parsed once and reloaded on change by the shared catalog
+    return catalog.get(role)
 
 def generate_questions(role: str):
     template = load_role_template(role)
@@ -0,0 +1,88 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from services import metrics
+
+# Bounded, per-process store of idempotency keys. A repeated submission with the
+# same key attaches to the in-flight job (or gets its finished result) instead
+# of creating another Firestore document and re-running the pipeline. Failed
+# jobs are forgotten so that a retry runs again. Keys derived from the upload
+# content only dedupe accidental double submits: once the job has finished they
+# expire after IDEMPOTENCY_CONTENT_TTL_S, so the same file can be re-analyzed.
+IDEMPOTENCY_TTL_S = float(os.getenv("IDEMPOTENCY_TTL_S", "3600"))
+IDEMPOTENCY_CONTENT_TTL_S = float(os.getenv("IDEMPOTENCY_CONTENT_TTL_S", "60"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "1024"))
+IDEMPOTENCY_WAIT_S = float(os.getenv("IDEMPOTENCY_WAIT_S", "600"))
+
+
+class Entry:
+    def __init__(self, key, ttl=None):
+        self.key = key
+        self.ttl = ttl  # seconds a finished result is kept (None = the store's TTL)
+        self.created = time.time()
+        self.finished = None
+        self.done = threading.Event()
+        self.result = None
+        self.meta = {}  # e.g. interviewId, available while the job is still running
+
+
+class IdempotencyStore:
+    def __init__(self, max_keys=IDEMPOTENCY_MAX_KEYS, ttl=IDEMPOTENCY_TTL_S):
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _expire(self, now):
+        while self.entries:
+            key, entry = next(iter(self.entries.items()))
+            if now - entry.created < self.ttl and len(self.entries) <= self.max_keys:
+                break
+            self.entries.popitem(last=False)
+
+    def begin(self, key: str, ttl: float = None):
+        """
+        Return (entry, is_new). Only the caller with is_new=True runs the job.
+        `ttl` shortens how long the finished result is kept for this key.
+        """
+        now = time.time()
+        with self.lock:
+            self._expire(now)
+            entry = self.entries.get(key)
+            if entry is not None and entry.ttl is not None and entry.finished and now - entry.finished >= entry.ttl:
+                del self.entries[key]
+                entry = None
+            if entry is not None:
+                metrics.inc("idempotency_requests_total", result="done" if entry.done.is_set() else "attached")
+                return entry, False
+            entry = self.entries[key] = Entry(key, ttl)
+            self._expire(now)
+        metrics.inc("idempotency_requests_total", result="new")
+        return entry, True
+
+    def complete(self, entry: Entry, result):
+        entry.result = result
+        entry.finished = time.time()
+        entry.done.set()
+
+    def fail(self, entry: Entry):
+        with self.lock:
+            if self.entries.get(entry.key) is entry:
+                del self.entries[entry.key]
+        entry.done.set()  # waiters see result=None and report the failure
+
+
+store = IdempotencyStore()
+
+
+def make_key(scope: str, user_id: str, client_key: str = None, content: bytes = None) -> str:
+    """
+    Client-supplied Idempotency-Key wins; otherwise hash of the upload content
+    (begin() such keys with ttl=IDEMPOTENCY_CONTENT_TTL_S).
+    """
+    if client_key:
+        return f"{scope}:{user_id}:key:{client_key}"
+    return f"{scope}:{user_id}:sha256:{hashlib.sha256(content or b'').hexdigest()}"
@@ -0,0 +1,256 @@
+"""Dedicated emotion-inference process shared by all HTTP workers.
+
+    python -m services.inference_server
+
+The wav2vec and distilroberta pipelines are loaded once here. Request workers
+(EMOTION_BACKEND=server) decode audio to float32 PCM, place it in a
+multiprocessing.shared_memory block and send only the block name over a local
+socket, so adding uvicorn workers adds almost no model memory.
+"""
+import os
+import stat
+import tempfile
+import threading
+import time
+import wave
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from services import metrics
+
+# Messages are pickles, so the authkey is what stops another local user (or, in
+# TCP mode, a network peer) from running code in this process. serve.py generates
+# a random key per run and passes it to the inference process and the workers via
+# the environment; there is deliberately no default.
+INFERENCE_ADDRESS = os.getenv("INFERENCE_ADDRESS") or os.path.join(
+    tempfile.gettempdir(), f"interview-analyzer-{getattr(os, 'getuid', lambda: 'user')()}", "inference.sock")
+INFERENCE_AUTHKEY = os.getenv("INFERENCE_AUTHKEY", "").encode()
+# Calls into each (read-only) model that may run at once across all connections;
+# pair with EMOTION_THREADS ≈ cores / INFERENCE_CONCURRENCY to avoid oversubscription
+INFERENCE_CONCURRENCY = int(os.getenv("INFERENCE_CONCURRENCY", "4"))
+INFERENCE_WORKER_TTL_S = float(os.getenv("INFERENCE_WORKER_TTL_S", "600"))
+SAMPLE_RATE = 16000
+
+
+def _address():
+    # "host:port" for TCP (e.g. on Windows), otherwise a Unix socket path
+    if ":" in INFERENCE_ADDRESS and not INFERENCE_ADDRESS.startswith("/"):
+        host, port = INFERENCE_ADDRESS.rsplit(":", 1)
+        return host, int(port)
+    return INFERENCE_ADDRESS
+
+
+def _authkey() -> bytes:
+    if not INFERENCE_AUTHKEY:
+        raise RuntimeError("INFERENCE_AUTHKEY is not set (start the app with serve.py, which generates one)")
+    return INFERENCE_AUTHKEY
+
+
+def _private_socket_dir(path: str):
+    """Create the socket's directory as 0700 and refuse to use one other users can enter."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.stat(directory)
+    if hasattr(os, "getuid") and (st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) & 0o077):
+        raise RuntimeError(f"Socket directory {directory} must be owned by this user with mode 0700")
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# ========= SERVER =========
+class InferenceServer:
+    def __init__(self):
+        self.started = time.time()
+        self.workers = {}  # pid -> {"rss": bytes, "seen": ts}
+        self.workers_lock = threading.Lock()
+        # One shared model per kind: inference doesn't mutate it, so connections
+        # only need a bound on concurrent calls, not exclusive access
+        self.model_slots = {
+            "audio": threading.BoundedSemaphore(INFERENCE_CONCURRENCY),
+            "text": threading.BoundedSemaphore(INFERENCE_CONCURRENCY),
+        }
+        self.requests = 0
+
+    def _classify_audio(self, msg):
+        from services import emotion_models
+
+        shm = shared_memory.SharedMemory(name=msg["shm"])
+        # The client owns the block; stop our resource tracker from unlinking it at exit
+        resource_tracker.unregister(shm._name, "shared_memory")
+        pcm = np.ndarray((msg["n"],), dtype=np.float32, buffer=shm.buf)
+        try:
+            model = emotion_models.get_local_audio_model()
+            with self.model_slots["audio"]:
+                return model({"raw": pcm, "sampling_rate": msg.get("sr", SAMPLE_RATE)}, **msg.get("kwargs", {}))
+        finally:
+            pcm = None
+            try:
+                shm.close()
+            except BufferError:
+                pass  # a traceback still references the view; the client unlinks the block anyway
+
+    def _classify_text(self, msg):
+        from services import emotion_models
+
+        model = emotion_models.get_local_text_model()
+        with self.model_slots["text"]:
+            return model(msg["texts"], **msg.get("kwargs", {}))
+
+    def _seen(self, pid, rss):
+        now = time.time()
+        with self.workers_lock:
+            new = pid not in self.workers
+            self.workers[pid] = {"rss": rss, "seen": now}
+            if new:  # a worker (re)started: drop the ones that are gone
+                self._prune(now)
+
+    def _prune(self, now):
+        local = isinstance(_address(), str)  # pids are only meaningful on this host
+        for pid, w in list(self.workers.items()):
+            if now - w["seen"] > INFERENCE_WORKER_TTL_S or (local and not _alive(pid)):
+                del self.workers[pid]
+
+    def _stats(self):
+        with self.workers_lock:
+            self._prune(time.time())
+            workers = {pid: dict(w) for pid, w in self.workers.items()}
+        return {
+            "pid": os.getpid(),
+            "rss": metrics.rss_bytes(),
+            "uptime": round(time.time() - self.started, 1),
+            "requests": self.requests,
+            "workers": workers,
+        }
+
+    def handle(self, msg):
+        if "pid" in msg:
+            self._seen(msg["pid"], msg.get("rss", 0))
+        op = msg["op"]
+        if op == "ping":
+            return "pong"
+        if op == "stats":
+            return self._stats()
+        self.requests += 1
+        if op == "audio":
+            return self._classify_audio(msg)
+        if op == "text":
+            return self._classify_text(msg)
+        raise ValueError(f"Unknown op: {op}")
+
+    def _serve_conn(self, conn):
+        with conn:
+            while True:
+                try:
+                    msg = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    conn.send({"ok": True, "result": self.handle(msg)})
+                except Exception as e:
+                    conn.send({"ok": False, "error": f"{type(e).__name__}: {e}"})
+
+    def serve_forever(self):
+        from services import emotion_models
+
+        authkey = _authkey()
+        address = _address()
+        if isinstance(address, str):
+            _private_socket_dir(address)
+            if os.path.exists(address):
+                os.remove(address)
+        emotion_models.warm_local()
+        with Listener(address, authkey=authkey) as listener:
+            print(f"🧠 Inference server ready on {INFERENCE_ADDRESS} (pid {os.getpid()}, RSS {metrics.rss_bytes() / 2**20:.0f} MiB)")
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self._serve_conn, args=(conn,), daemon=True).start()
+
+
+# ========= CLIENT =========
+_local = threading.local()
+
+
+def _call(msg, retry=True):
+    conn = getattr(_local, "conn", None)
+    try:
+        if conn is None:
+            conn = _local.conn = Client(_address(), authkey=_authkey())
+        conn.send({**msg, "pid": os.getpid(), "rss": metrics.rss_bytes()})
+        reply = conn.recv()
+    except (EOFError, OSError, ConnectionError):
+        _local.conn = None
+        if retry:
+            return _call(msg, retry=False)
+        raise RuntimeError(f"Inference server unavailable at {INFERENCE_ADDRESS}")
+    if not reply["ok"]:
+        raise RuntimeError(f"Inference server error: {reply['error']}")
+    return reply["result"]
+
+
+def read_pcm_into_shm(wav_path: str):
+    """Decode a 16-bit mono WAV straight into a new shared-memory float32 block."""
+    with wave.open(wav_path, "rb") as w:
+        if w.getsampwidth() != 2 or w.getnchannels() != 1:
+            raise ValueError("Expected 16-bit mono WAV (see to_wav)")
+        sr = w.getframerate()
+        raw = w.readframes(w.getnframes())
+    pcm16 = np.frombuffer(raw, dtype=np.int16)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, pcm16.size * 4))
+    out = np.ndarray((pcm16.size,), dtype=np.float32, buffer=shm.buf)
+    np.multiply(pcm16, 1.0 / 32768.0, out=out, casting="unsafe")
+    del out
+    return shm, pcm16.size, sr
+
+
+class RemoteAudioModel:
+    """Drop-in for the audio-classification pipeline: model(wav_path) -> [{label, score}]."""
+
+    def __call__(self, inputs, **kwargs):
+        if isinstance(inputs, dict):
+            pcm = np.ascontiguousarray(inputs["raw"], dtype=np.float32)
+            shm = shared_memory.SharedMemory(create=True, size=max(1, pcm.nbytes))
+            np.ndarray(pcm.shape, dtype=np.float32, buffer=shm.buf)[:] = pcm
+            n, sr = pcm.size, inputs.get("sampling_rate", SAMPLE_RATE)
+        else:
+            shm, n, sr = read_pcm_into_shm(inputs)
+        try:
+            return _call({"op": "audio", "shm": shm.name, "n": n, "sr": sr, "kwargs": kwargs})
+        finally:
+            shm.close()
+            shm.unlink()
+
+
+class RemoteTextModel:
+    """Drop-in for the text-classification pipeline (strings are small; sent inline)."""
+
+    def __call__(self, texts, **kwargs):
+        return _call({"op": "text", "texts": texts, "kwargs": kwargs})
+
+
+def ping(timeout: float = 0.0) -> bool:
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return _call({"op": "ping"}, retry=False) == "pong"
+        except Exception:
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.5)
+
+
+def stats():
+    return _call({"op": "stats"})
+
+
+if __name__ == "__main__":
+    InferenceServer().serve_forever()
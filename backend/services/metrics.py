@@ -0,0 +1,255 @@
+import contextvars
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# In-process metrics registry exported in Prometheus text format on /metrics,
+# plus a per-job trace of stage timings keyed by trace ID.
+
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+MAX_TRACES = int(os.getenv("METRICS_MAX_TRACES", "500"))
+
+_lock = threading.Lock()
+_counters = {}     # (name, labels) -> float
+_gauges = {}       # (name, labels) -> float
+_histograms = {}   # (name, labels) -> [bucket_counts, sum, count]
+_traces = OrderedDict()  # trace_id -> {"startedAt": ts, "spans": [...]}
+
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+
+HELP = {
+    "stage_duration_seconds": "Duration of pipeline stages (upload, ffmpeg, probe, asr, emotion, llm, firestore).",
+    "stage_errors_total": "Pipeline stages that raised an exception.",
+    "stage_in_flight": "Pipeline stages currently executing.",
+    "http_request_duration_seconds": "HTTP request latency by route.",
+    "http_requests_in_flight": "HTTP requests currently being served.",
+    "batch_queue_depth": "Batch jobs waiting for each pipeline stage.",
+    "batch_files_total": "Files processed by /analyze/batch, by outcome.",
+    "scheduler_queue_depth": "Requests waiting for each scheduler resource class.",
+    "scheduler_in_use": "Slots in use per scheduler resource class.",
+    "scheduler_wait_seconds": "Time spent waiting for a scheduler slot or upstream token.",
+    "scheduler_rejected_total": "Requests rejected with 429, by resource and reason.",
+    "idempotency_requests_total": "Idempotent submissions by outcome (new, attached, done).",
+    "emotion_text_sentences_total": "Sentences sent to the text-emotion model.",
+    "emotion_text_sentences_deduplicated_total": "Repeated sentences answered from the same batch.",
+    "storage_used_bytes": "Bytes used under uploads/ (last sweep plus writes since).",
+    "storage_files": "Files under uploads/ at the last sweep.",
+    "storage_owners_over_quota": "Users above STORAGE_USER_QUOTA_MB after the last sweep (only pinned or recent files left).",
+    "storage_reclaimed_bytes_total": "Bytes freed, by reason (age, user_quota, global_quota, archive).",
+    "storage_evicted_files_total": "Files evicted by the sweeper, by reason.",
+    "storage_temp_files_removed_total": "Request temp files (spooled uploads, converted WAVs) deleted.",
+    "storage_temp_bytes_removed_total": "Bytes freed by deleting request temp files.",
+    "storage_archive_queue": "Uploads waiting for Opus archival.",
+    "storage_sweep_seconds": "Duration of storage sweeps.",
+    "object_upload_total": "Object-storage uploads by mode and outcome.",
+    "object_upload_bytes_total": "Bytes uploaded to object storage, by mode.",
+    "object_upload_seconds": "Time from first byte read to object available, by mode.",
+    "cache_requests_total": "Cache lookups by cache and result (hit/miss).",
+    "role_catalog_loads_total": "Role template files parsed (initial load and reloads on change).",
+    "role_catalog_roles": "Role templates currently indexed.",
+    "cache_hit_ratio": "Cache hit ratio since process start.",
+    "model_load_seconds": "Time taken to load each ML model.",
+    "process_resident_memory_bytes": "Resident set size of this process.",
+    "worker_resident_memory_bytes": "Last reported RSS of each HTTP worker (EMOTION_BACKEND=server).",
+    "inference_server_resident_memory_bytes": "RSS of the shared inference process.",
+}
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+# ========= PRIMITIVES =========
+def inc(name: str, value: float = 1, **labels):
+    k = _key(name, labels)
+    with _lock:
+        _counters[k] = _counters.get(k, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def add_gauge(name: str, delta: float, **labels):
+    k = _key(name, labels)
+    with _lock:
+        _gauges[k] = _gauges.get(k, 0) + delta
+
+
+def observe(name: str, value: float, **labels):
+    k = _key(name, labels)
+    with _lock:
+        h = _histograms.get(k)
+        if h is None:
+            h = _histograms[k] = [[0] * len(DEFAULT_BUCKETS), 0.0, 0]
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if value <= bound:
+                h[0][i] += 1
+        h[1] += value
+        h[2] += 1
+
+
+def record_cache(cache: str, hit: bool):
+    inc("cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+
+# ========= TRACING =========
+def new_trace(trace_id: str = None) -> str:
+    """Start a trace for the current request/job and make it the active one."""
+    trace_id = trace_id or uuid.uuid4().hex
+    _trace_id.set(trace_id)
+    with _lock:
+        if trace_id not in _traces:
+            _traces[trace_id] = {"traceId": trace_id, "startedAt": time.time(), "spans": []}
+            while len(_traces) > MAX_TRACES:
+                _traces.popitem(last=False)
+    return trace_id
+
+
+def current_trace_id():
+    return _trace_id.get()
+
+
+def get_trace(trace_id: str):
+    with _lock:
+        t = _traces.get(trace_id)
+        return None if t is None else {**t, "spans": list(t["spans"])}
+
+
+def trace_timings(trace_id: str = None) -> dict:
+    """Total seconds per stage for a trace, e.g. for storing on the job document."""
+    t = get_trace(trace_id or current_trace_id() or "")
+    if not t:
+        return {}
+    out = {}
+    for s in t["spans"]:
+        out[s["stage"]] = round(out.get(s["stage"], 0) + s["seconds"], 4)
+    return out
+
+
+def _record_span(stage_name, seconds, labels, ok):
+    trace_id = _trace_id.get()
+    if not trace_id:
+        return
+    with _lock:
+        t = _traces.get(trace_id)
+        if t is not None:
+            t["spans"].append({
+                "stage": stage_name,
+                "seconds": round(seconds, 4),
+                "offset": round(time.time() - seconds - t["startedAt"], 4),
+                "ok": ok,
+                **labels,
+            })
+
+
+@contextmanager
+def stage(name: str, **labels):
+    """Time a pipeline stage into the stage histogram and the active trace."""
+    add_gauge("stage_in_flight", 1, stage=name)
+    t0 = time.perf_counter()
+    ok = True
+    try:
+        yield
+    except BaseException:
+        ok = False
+        inc("stage_errors_total", stage=name, **labels)
+        raise
+    finally:
+        dt = time.perf_counter() - t0
+        add_gauge("stage_in_flight", -1, stage=name)
+        observe("stage_duration_seconds", dt, stage=name, **labels)
+        _record_span(name, dt, labels, ok)
+
+
+@contextmanager
+def model_load(model: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        set_gauge("model_load_seconds", round(dt, 3), model=model)
+        print(f"⏱ Loaded {model} in {dt:.2f}s")
+
+
+# ========= EXPORT =========
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except Exception:
+        return 0
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in items)
+    return "{" + body + "}"
+
+
+def _cache_ratios():
+    totals = {}
+    for (name, labels), v in _counters.items():
+        if name != "cache_requests_total":
+            continue
+        d = dict(labels)
+        hits, total = totals.get(d["cache"], (0, 0))
+        totals[d["cache"]] = (hits + (v if d["result"] == "hit" else 0), total + v)
+    return {(("cache", c),): (h / t if t else 0.0) for c, (h, t) in totals.items()}
+
+
+def render() -> str:
+    """Prometheus text exposition of every metric recorded so far."""
+    set_gauge("process_resident_memory_bytes", rss_bytes(), pid=os.getpid())
+    lines = []
+
+    def header(name, kind):
+        if name in HELP:
+            lines.append(f"# HELP {name} {HELP[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {k: (list(v[0]), v[1], v[2]) for k, v in _histograms.items()}
+        for labels, ratio in _cache_ratios().items():
+            gauges[("cache_hit_ratio", labels)] = ratio
+
+    for kind, series in (("counter", counters), ("gauge", gauges)):
+        seen = set()
+        for (name, labels), v in sorted(series.items()):
+            if name not in seen:
+                header(name, kind)
+                seen.add(name)
+            lines.append(f"{name}{_fmt_labels(labels)} {v}")
+
+    seen = set()
+    for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+        if name not in seen:
+            header(name, "histogram")
+            seen.add(name)
+        for bound, c in zip(DEFAULT_BUCKETS, buckets):
+            lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', bound)])} {c}")
+        lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {count}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {total}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {count}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,463 @@
+import asyncio
+import io
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from services import metrics
+
+# Streaming uploads to object storage (Firebase Storage / GCS).
+# The request body is read in UPLOAD_CHUNK_MB pieces and handed to a thread pool
+# as it arrives. POST /upload/cloud parses multipart/form-data straight from
+# request.stream() (MultipartFileSource), so the body is never buffered whole or
+# spooled to a temp file. A FastAPI UploadFile also works as a source, but
+# Starlette has already spooled it to a SpooledTemporaryFile by then.
+#   composite — each chunk is uploaded as a part object in parallel (at most
+#               UPLOAD_CONCURRENCY in flight), then the parts are composed
+#               into the final object and deleted
+#   resumable — chunks are written in order to one resumable upload session
+# The request only waits while chunks are being read; composing, making the
+# object public and the last part uploads finish in the background (poll
+# get_job() or wait on job.done).
+#
+# OBJECT_STORAGE_BACKEND=gcs uses the Firebase bucket (FIREBASE_STORAGE_BUCKET);
+# setting STORAGE_EMULATOR_HOST points it at fake-gcs-server. =local writes to
+# OBJECT_STORAGE_DIR with optional simulated latency/bandwidth for benchmarks.
+OBJECT_STORAGE_BACKEND = os.getenv("OBJECT_STORAGE_BACKEND", "gcs")
+OBJECT_STORAGE_DIR = os.getenv("OBJECT_STORAGE_DIR", os.path.join(os.path.dirname(__file__), "..", "data", "object_store"))
+FIREBASE_STORAGE_BUCKET = os.getenv("FIREBASE_STORAGE_BUCKET", "your-project-id.appspot.com")
+UPLOAD_MODE = os.getenv("UPLOAD_MODE", "composite")
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+_GCS_CHUNK_ALIGN = 256 * 1024  # resumable chunk sizes must be multiples of 256 KiB
+UPLOAD_CHUNK_BYTES = max(1, round(float(os.getenv("UPLOAD_CHUNK_MB", "8")) * 4)) * _GCS_CHUNK_ALIGN
+COMPOSE_MAX_SOURCES = 32  # GCS compose limit per call
+MAX_JOBS = 1000
+
+
+# ========= BACKENDS =========
+class LocalBackend:
+    """A directory used as a bucket. latency_ms/bandwidth_mbps simulate a remote store per request."""
+
+    def __init__(self, root: str = OBJECT_STORAGE_DIR, latency_ms: float = 0, bandwidth_mbps: float = 0):
+        self.root = os.path.abspath(root)
+        self.latency_ms = latency_ms
+        self.bandwidth_mbps = bandwidth_mbps
+
+    def _path(self, name):
+        path = os.path.abspath(os.path.join(self.root, name))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid object name: {name}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def _transfer(self, nbytes):
+        delay = self.latency_ms / 1000
+        if self.bandwidth_mbps:
+            delay += nbytes * 8 / (self.bandwidth_mbps * 1e6)
+        if delay:
+            time.sleep(delay)
+
+    def write_part(self, name: str, data: bytes):
+        self._transfer(len(data))
+        with open(self._path(name), "wb") as f:
+            f.write(data)
+
+    def compose(self, name: str, sources):
+        self._transfer(0)
+        tmp = self._path(name) + ".compose"
+        with open(tmp, "wb") as out:
+            for src in sources:
+                with open(self._path(src), "rb") as f:
+                    shutil.copyfileobj(f, out, 1024 * 1024)
+        os.replace(tmp, self._path(name))
+
+    def delete(self, name: str):
+        path = self._path(name)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        # Composite parts live under <name>.parts/; the last one out removes the directory
+        parent = os.path.dirname(path)
+        if parent.endswith(".parts"):
+            try:
+                os.rmdir(parent)
+            except OSError:
+                pass  # other parts are still there
+
+    def open_writer(self, name: str):
+        backend = self
+
+        class _Writer(io.FileIO):
+            def write(self, data):
+                backend._transfer(len(data))
+                return super().write(data)
+
+        return _Writer(self._path(name), "wb")
+
+    def make_public(self, name: str):
+        return f"file://{self._path(name)}"
+
+
+class GCSBackend:
+    """Firebase Storage bucket through google-cloud-storage (honours STORAGE_EMULATOR_HOST)."""
+
+    def __init__(self, bucket_name: str = FIREBASE_STORAGE_BUCKET):
+        self.bucket_name = bucket_name
+        self._bucket = None
+        self._lock = threading.Lock()
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            with self._lock:
+                if self._bucket is None:
+                    from firebase_admin import storage
+                    from services.firestore_client import get_db
+
+                    get_db()  # initialises the Firebase app from FIREBASE_CREDENTIALS
+                    self._bucket = storage.bucket(self.bucket_name)
+        return self._bucket
+
+    def write_part(self, name: str, data: bytes):
+        self.bucket.blob(name).upload_from_file(io.BytesIO(data), size=len(data))
+
+    def compose(self, name: str, sources):
+        self.bucket.blob(name).compose([self.bucket.blob(s) for s in sources])
+
+    def delete(self, name: str):
+        from google.api_core.exceptions import NotFound
+        try:
+            self.bucket.blob(name).delete()
+        except NotFound:
+            pass
+
+    def open_writer(self, name: str):
+        return self.bucket.blob(name).open("wb", chunk_size=UPLOAD_CHUNK_BYTES)
+
+    def make_public(self, name: str):
+        blob = self.bucket.blob(name)
+        blob.make_public()
+        return blob.public_url
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = LocalBackend() if OBJECT_STORAGE_BACKEND == "local" else GCSBackend()
+    return _backend
+
+
+def set_backend(backend):
+    """Install a backend explicitly (e.g. a throttled LocalBackend in bench/)."""
+    global _backend
+    _backend = backend
+
+
+# ========= SOURCES =========
+def _multipart():
+    try:
+        from python_multipart.multipart import MultipartParser, parse_options_header
+    except ImportError:  # python-multipart < 0.0.13
+        from multipart.multipart import MultipartParser, parse_options_header
+    return MultipartParser, parse_options_header
+
+
+class MultipartFileSource:
+    """
+    async read(n) over one file field of a multipart/form-data request, parsed
+    from request.stream() as it arrives. Call start() first: it reads up to the
+    file part's headers and sets filename/content_type; plain form fields sent
+    before the file end up in `fields`.
+    """
+
+    def __init__(self, request, field: str = "file", max_field_bytes: int = 64 * 1024):
+        parser_cls, parse_options_header = _multipart()
+        self._parse_options = parse_options_header
+        content_type, params = parse_options_header(request.headers.get("content-type", ""))
+        boundary = params.get(b"boundary")
+        if content_type.lower() != b"multipart/form-data" or not boundary:
+            raise ValueError("Expected a multipart/form-data body")
+        self.field = field
+        self.max_field_bytes = max_field_bytes
+        self.filename = None
+        self.content_type = None
+        self.fields = {}
+        self._stream = request.stream()
+        self._buf = bytearray()
+        self._found = self._in_file = self._file_done = self._eof = False
+        self._name = ""
+        self._headers, self._header, self._value, self._data = {}, b"", b"", b""
+        self._parser = parser_cls(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    # ---------- parser callbacks ----------
+    def _on_part_begin(self):
+        self._headers, self._data = {}, b""
+
+    def _on_header_field(self, data, start, end):
+        self._header += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header.lower()] = self._value
+        self._header, self._value = b"", b""
+
+    def _on_headers_finished(self):
+        _, options = self._parse_options(self._headers.get(b"content-disposition", b""))
+        self._name = options.get(b"name", b"").decode("latin-1")
+        filename = options.get(b"filename")
+        self._in_file = not self._found and self._name == self.field and filename is not None
+        if self._in_file:
+            self._found = True
+            self.filename = os.path.basename(filename.decode("utf-8", "replace"))
+            self.content_type = self._headers.get(b"content-type", b"application/octet-stream").decode("latin-1")
+
+    def _on_part_data(self, data, start, end):
+        if self._in_file:
+            self._buf += data[start:end]
+        elif not self._found:
+            self._data += data[start:end]
+            if len(self._data) > self.max_field_bytes:
+                raise ValueError(f"Form field {self._name!r} is too large")
+
+    def _on_part_end(self):
+        if self._in_file:
+            self._in_file = False
+            self._file_done = True
+        elif not self._found:
+            self.fields[self._name] = self._data.decode("utf-8", "replace")
+
+    # ---------- reading ----------
+    async def _pump(self):
+        try:
+            chunk = await self._stream.__anext__()
+        except StopAsyncIteration:
+            self._parser.finalize()
+            self._eof = True
+            return
+        self._parser.write(chunk)
+
+    async def start(self):
+        while not self._found and not self._eof:
+            await self._pump()
+        if not self._found:
+            raise ValueError(f"No file in form field {self.field!r}")
+        return self
+
+    async def read(self, n: int = -1) -> bytes:
+        while not self._file_done and (n < 0 or len(self._buf) < n):
+            if self._eof:
+                raise ValueError("Multipart body ended before the file part was complete")
+            await self._pump()
+        n = len(self._buf) if n < 0 else min(n, len(self._buf))
+        data = bytes(self._buf[:n])
+        del self._buf[:n]
+        return data
+
+
+# ========= JOBS =========
+# Part uploads and job completion use separate pools so a completing job that
+# waits for its parts can never occupy the threads those parts need.
+_part_pool = ThreadPoolExecutor(max_workers=int(os.getenv("UPLOAD_WORKERS", "16")), thread_name_prefix="object-part")
+_finish_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="object-finish")
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class UploadJob:
+    def __init__(self, name: str, mode: str):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.mode = mode
+        self.bytes = 0
+        self.parts = 0
+        self.started = time.perf_counter()
+        self.read_seconds = None
+        self.seconds = None
+        self.url = None
+        self.error = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        status = "failed" if self.error else "completed" if self.done.is_set() else "uploading"
+        return {
+            "jobId": self.id, "name": self.name, "mode": self.mode, "status": status,
+            "bytes": self.bytes, "parts": self.parts, "url": self.url, "error": self.error,
+            "readSeconds": self.read_seconds, "seconds": self.seconds,
+            "mbPerSecond": round(self.bytes / 2**20 / self.seconds, 2) if self.seconds else None,
+        }
+
+
+def get_job(job_id: str):
+    return _jobs.get(job_id)
+
+
+def _register(job):
+    with _jobs_lock:
+        _jobs[job.id] = job
+        while len(_jobs) > MAX_JOBS:
+            _jobs.pop(next(iter(_jobs)))
+
+
+def _finish(job, fn):
+    try:
+        fn()
+    except Exception as e:
+        job.error = f"{type(e).__name__}: {e}"
+        print(f"❌ Upload of {job.name} failed: {job.error}")
+        metrics.inc("object_upload_total", mode=job.mode, status="failed")
+    else:
+        metrics.inc("object_upload_total", mode=job.mode, status="completed")
+        metrics.inc("object_upload_bytes_total", job.bytes, mode=job.mode)
+    finally:
+        job.seconds = round(time.perf_counter() - job.started, 3)
+        metrics.observe("object_upload_seconds", job.seconds, mode=job.mode)
+        job.done.set()
+
+
+def _compose_all(backend, name, parts):
+    """Compose in rounds of COMPOSE_MAX_SOURCES; intermediate objects are deleted afterwards."""
+    created = []
+    level = 0
+    while len(parts) > COMPOSE_MAX_SOURCES:
+        groups = [parts[i:i + COMPOSE_MAX_SOURCES] for i in range(0, len(parts), COMPOSE_MAX_SOURCES)]
+        parts = []
+        for i, group in enumerate(groups):
+            target = f"{name}.parts/c{level}-{i:05d}"
+            backend.compose(target, group)
+            parts.append(target)
+        created += parts
+        level += 1
+    backend.compose(name, parts)
+    return created
+
+
+async def _read_chunks(source, chunk_bytes):
+    """Yield fixed-size chunks from an UploadFile-like object with async read(n)."""
+    while True:
+        chunk = await source.read(chunk_bytes)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def _upload_composite(job, backend, source, make_public):
+    loop = asyncio.get_running_loop()
+    slots = threading.Semaphore(UPLOAD_CONCURRENCY)  # bounds memory to concurrency × chunk size
+    futures, part_names = [], []
+
+    def _put(part, data):
+        try:
+            with metrics.stage("object_upload", op="part"):
+                backend.write_part(part, data)
+        finally:
+            slots.release()
+
+    def _cleanup():
+        for fut in futures:
+            fut.exception()  # wait for stragglers before deleting their parts
+        for name in part_names:
+            backend.delete(name)
+
+    try:
+        async for chunk in _read_chunks(source, UPLOAD_CHUNK_BYTES):
+            await loop.run_in_executor(None, slots.acquire)
+            part = f"{job.name}.parts/{len(part_names):05d}"
+            part_names.append(part)
+            futures.append(_part_pool.submit(_put, part, chunk))
+            job.bytes += len(chunk)
+            job.parts += 1
+    except BaseException:
+        _finish_pool.submit(_cleanup)  # e.g. client disconnected mid-body
+        raise
+    job.read_seconds = round(time.perf_counter() - job.started, 3)
+
+    def _complete():
+        created = []
+        try:
+            for fut in futures:
+                fut.result()
+            if not part_names:
+                backend.write_part(job.name, b"")
+            elif len(part_names) == 1:
+                backend.compose(job.name, part_names)
+            else:
+                with metrics.stage("object_upload", op="compose"):
+                    created = _compose_all(backend, job.name, part_names)
+            if make_public:
+                job.url = backend.make_public(job.name)
+        finally:
+            _cleanup()
+            for name in created:
+                backend.delete(name)
+
+    _finish_pool.submit(_finish, job, _complete)
+
+
+async def _upload_resumable(job, backend, source, make_public):
+    loop = asyncio.get_running_loop()
+    writer = await loop.run_in_executor(_finish_pool, backend.open_writer, job.name)
+    pending = None
+    try:
+        async for chunk in _read_chunks(source, UPLOAD_CHUNK_BYTES):
+            if pending is not None:
+                await asyncio.wrap_future(pending)  # one chunk in flight while the next is read
+            pending = _part_pool.submit(writer.write, chunk)
+            job.bytes += len(chunk)
+            job.parts += 1
+    except BaseException:
+        _finish_pool.submit(writer.close)
+        raise
+    job.read_seconds = round(time.perf_counter() - job.started, 3)
+
+    def _complete():
+        try:
+            if pending is not None:
+                pending.result()
+        finally:
+            with metrics.stage("object_upload", op="finalize"):
+                writer.close()
+        if make_public:
+            job.url = backend.make_public(job.name)
+
+    _finish_pool.submit(_finish, job, _complete)
+
+
+async def upload_stream(source, name: str, mode: str = None, make_public: bool = True) -> UploadJob:
+    """
+    Stream `source` (a MultipartFileSource, UploadFile or anything with `async read(n)`) to object
+    `name`. Returns once the body has been read; the job completes in the background.
+    """
+    mode = mode or UPLOAD_MODE
+    if mode not in ("composite", "resumable"):
+        raise ValueError(f"Unknown UPLOAD_MODE: {mode}")
+    job = UploadJob(name, mode)
+    _register(job)
+    backend = get_backend()
+    try:
+        if mode == "composite":
+            await _upload_composite(job, backend, source, make_public)
+        else:
+            await _upload_resumable(job, backend, source, make_public)
+    except Exception as e:
+        job.error = f"{type(e).__name__}: {e}"
+        metrics.inc("object_upload_total", mode=mode, status="failed")
+        job.done.set()
+        raise
+    return job
@@ -0,0 +1,112 @@
+import glob
+import json
+import os
+import re
+import threading
+import time
+
+from services import metrics
+
+# In-memory index of data/role_templates/*.json. Templates are parsed once and
+# re-read only when a file's mtime changes (checked at most every
+# ROLE_CATALOG_CHECK_S seconds). The static part of each role's question prompt
+# is built at load time, so requests only format the per-round lines and the
+# prefix stays byte-identical between calls (sent as a Gemini system
+# instruction, where repeated prefixes can be served from the provider cache).
+ROLE_DIR = os.getenv("ROLE_TEMPLATES_DIR", os.path.join(os.path.dirname(__file__), "..", "data", "role_templates"))
+ROLE_CATALOG_CHECK_S = float(os.getenv("ROLE_CATALOG_CHECK_S", "2"))
+
+QUESTIONS_PREFIX = """
+You are an expert AI interview coach.
+Role: {title}
+{focus}
+Task: Generate exactly 8 realistic interview questions for this role, following the
+difficulty and focus strategy given in the request.
+Return ONLY a JSON array of strings. No markdown, no keys, just the list.
+""".strip()
+
+
+def slug(role: str) -> str:
+    """'Software Developer' / 'software-developer' -> 'software_developer'."""
+    return re.sub(r"[^a-z0-9]+", "_", (role or "").lower()).strip("_")
+
+
+def _questions_prefix(template: dict) -> str:
+    focus = template.get("focus_areas") or []
+    return QUESTIONS_PREFIX.format(
+        title=template.get("title", ""),
+        focus=f"Focus areas: {', '.join(focus)}.\n" if focus else "",
+    )
+
+
+class RoleCatalog:
+    def __init__(self, directory: str = ROLE_DIR):
+        self.directory = os.path.abspath(directory)
+        self.files = {}  # path -> (mtime, slug, entry)
+        self.index = {}  # slug or slug(title) -> entry
+        self.checked = 0.0
+        self.lock = threading.Lock()
+
+    def _refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.checked < ROLE_CATALOG_CHECK_S:
+            return
+        with self.lock:
+            if not force and now - self.checked < ROLE_CATALOG_CHECK_S:
+                return
+            paths = set(glob.glob(os.path.join(self.directory, "*.json")))
+            changed = paths != set(self.files)
+            files = {}
+            for path in paths:
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    continue
+                old = self.files.get(path)
+                if old and old[0] == mtime:
+                    files[path] = old
+                    continue
+                try:
+                    with open(path, encoding="utf-8") as f:
+                        template = json.load(f)
+                except (OSError, json.JSONDecodeError) as e:
+                    print(f"⚠️  Could not load role template {path}: {e}")
+                    if old:
+                        files[path] = old  # keep serving the last good version
+                    continue
+                key = slug(os.path.splitext(os.path.basename(path))[0])
+                template.setdefault("title", key.replace("_", " ").title())
+                files[path] = (mtime, key, {"id": key, "template": template, "questionsPrefix": _questions_prefix(template)})
+                changed = True
+                metrics.inc("role_catalog_loads_total")
+            if changed:
+                index = {}
+                for _, _, entry in files.values():
+                    index[slug(entry["template"]["title"])] = entry
+                for _, key, entry in files.values():
+                    index[key] = entry  # file names win over titles
+                self.files, self.index = files, index
+                metrics.set_gauge("role_catalog_roles", len(files))
+            self.checked = now
+
+    def _entry(self, role: str):
+        self._refresh()
+        entry = self.index.get(slug(role))
+        metrics.record_cache("role_catalog", entry is not None)  # miss: no template, generic prompt
+        return entry
+
+    def get(self, role: str) -> dict:
+        """Role template, or {"title": role} for roles without a template file."""
+        entry = self._entry(role)
+        return entry["template"] if entry else {"title": role}
+
+    def questions_prefix(self, role: str) -> str:
+        entry = self._entry(role)
+        return entry["questionsPrefix"] if entry else _questions_prefix({"title": role})
+
+    def roles(self):
+        self._refresh()
+        return sorted({e["id"]: e["template"]["title"] for e in self.index.values()}.items())
+
+
+catalog = RoleCatalog()
@@ -0,0 +1,279 @@
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from services import metrics
+
+# Scheduling layer for the heavy routes (/analyze, /analyze/batch, /emotion,
+# /practice/finish):
+#   - admission control: per-user in-flight job cap and bounded queues, so
+#     overload turns into 429 + Retry-After instead of unbounded queueing
+#   - per resource class (cpu inference, asr calls, llm calls) a global
+#     concurrency cap whose waiters are served by weighted fair queuing per user
+#   - token buckets per upstream API (whisper, gemini)
+# Queue limits and the wait timeout apply at admission and to unadmitted callers.
+# Once admit() has accepted a job, its stage slots wait instead of raising, so
+# overload can't turn into a 429 after part of the pipeline has already run.
+# Blocking waits are thread-based, so callers must run in the threadpool.
+
+
+class Overloaded(Exception):
+    """Raised when a request can't be admitted; mapped to HTTP 429 in main.py."""
+
+    def __init__(self, resource: str, reason: str, retry_after: float):
+        super().__init__(f"{resource} overloaded ({reason})")
+        self.resource = resource
+        self.reason = reason
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+def _env_int(name, default):
+    return int(os.getenv(name, str(default)))
+
+
+USER_WEIGHTS = json.loads(os.getenv("USER_WEIGHTS", "{}"))  # {"uid": 2.0}
+PER_USER_MAX_JOBS = _env_int("SCHED_PER_USER_MAX_JOBS", 2)
+MAX_WAIT_S = float(os.getenv("SCHED_MAX_WAIT_S", "120"))
+
+_current_user = contextvars.ContextVar("sched_user", default="anonymous")
+_admitted = contextvars.ContextVar("sched_admitted", default=False)
+
+
+def set_user(user: str, admitted: bool = False):
+    """Attribute slots taken in this context to `user` (admitted=True: a job admit() accepted)."""
+    _current_user.set(user or "anonymous")
+    _admitted.set(admitted)
+
+
+def current_user() -> str:
+    return _current_user.get()
+
+
+def _weight(user):
+    return float(USER_WEIGHTS.get(user, 1.0))
+
+
+# ========= FAIR SEMAPHORE =========
+class _Ticket:
+    __slots__ = ("user", "event", "cancelled")
+
+    def __init__(self, user):
+        self.user = user
+        self.event = threading.Event()
+        self.cancelled = False
+
+
+class FairSemaphore:
+    """
+    Concurrency cap with start-time fair queuing: each waiter gets a virtual
+    start tag max(vtime, user's last tag) + 1/weight, and freed slots go to the
+    smallest tag, so a user with many queued requests can't starve the others.
+    """
+
+    def __init__(self, name, capacity, max_queue, max_user_queue):
+        self.name = name
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.max_user_queue = max_user_queue
+        self.in_use = 0
+        self.vtime = 0.0
+        self.last_tag = {}
+        self.queued = {}  # user -> waiting count
+        self.heap = []
+        self.seq = itertools.count()
+        self.avg_service = 1.0  # EWMA of hold time, used for Retry-After
+        self.lock = threading.Lock()
+
+    def _retry_after(self, ahead):
+        return self.avg_service * (ahead + 1) / self.capacity
+
+    def _publish(self):
+        metrics.set_gauge("scheduler_in_use", self.in_use, resource=self.name)
+        metrics.set_gauge("scheduler_queue_depth", sum(self.queued.values()), resource=self.name)
+
+    def check(self, user):
+        """Fail fast (before any pipeline work starts) if this resource is saturated.
+        The multipart body has already been parsed by the time this runs."""
+        with self.lock:
+            waiting = sum(self.queued.values())
+            reason = "queue_full" if waiting >= self.max_queue else (
+                "user_queue_full" if self.queued.get(user, 0) >= self.max_user_queue else None)
+            if reason:
+                metrics.inc("scheduler_rejected_total", resource=self.name, reason=reason)
+                raise Overloaded(self.name, reason, self._retry_after(waiting))
+
+    def acquire(self, user, timeout=MAX_WAIT_S, bounded=True):
+        """
+        Take a slot, waiting in fair order. bounded=False skips the queue limits
+        (for admitted jobs, already checked by admit()); timeout=None waits indefinitely.
+        """
+        with self.lock:
+            waiting = sum(self.queued.values())
+            prev_tag = self.last_tag.get(user)
+            tag = max(self.vtime, prev_tag or 0.0) + 1.0 / _weight(user)
+            if self.in_use < self.capacity and not self.heap:
+                self.last_tag[user] = tag
+                self.in_use += 1
+                self.vtime = tag
+                self._publish()
+                return 0.0
+            if bounded and (waiting >= self.max_queue or self.queued.get(user, 0) >= self.max_user_queue):
+                metrics.inc("scheduler_rejected_total", resource=self.name, reason="queue_full")
+                raise Overloaded(self.name, "queue_full", self._retry_after(waiting))
+            # Only admitted requests advance the user's virtual time
+            self.last_tag[user] = tag
+            ticket = _Ticket(user)
+            heapq.heappush(self.heap, (tag, next(self.seq), ticket))
+            self.queued[user] = self.queued.get(user, 0) + 1
+            self._publish()
+
+        t0 = time.perf_counter()
+        if not ticket.event.wait(timeout):
+            with self.lock:
+                if not ticket.event.is_set():
+                    ticket.cancelled = True
+                    self.queued[user] -= 1
+                    if self.last_tag.get(user) == tag:
+                        # Timed out without service: don't charge the user for it
+                        if prev_tag is None:
+                            del self.last_tag[user]
+                        else:
+                            self.last_tag[user] = prev_tag
+                    self._publish()
+                    metrics.inc("scheduler_rejected_total", resource=self.name, reason="timeout")
+                    raise Overloaded(self.name, "timeout", self._retry_after(len(self.heap)))
+        waited = time.perf_counter() - t0
+        metrics.observe("scheduler_wait_seconds", waited, resource=self.name)
+        return waited
+
+    def release(self, held_for):
+        with self.lock:
+            self.avg_service = 0.8 * self.avg_service + 0.2 * held_for
+            while self.heap:
+                tag, _, ticket = heapq.heappop(self.heap)
+                if ticket.cancelled:
+                    continue
+                self.queued[ticket.user] -= 1
+                self.vtime = tag
+                ticket.event.set()  # slot passes straight to the next waiter
+                break
+            else:
+                self.in_use -= 1
+                self.last_tag.clear()  # idle: every granted tag <= vtime, nothing to remember
+            self._publish()
+
+
+# ========= TOKEN BUCKET =========
+class TokenBucket:
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, max_wait=MAX_WAIT_S):
+        """
+        Block until a token is available, or raise Overloaded if that would exceed
+        max_wait (None: always wait).
+        """
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1  # reserve now; a negative balance is the queue
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            if max_wait is not None and wait > max_wait:
+                self.tokens += 1
+                metrics.inc("scheduler_rejected_total", resource=self.name, reason="rate_limit")
+                raise Overloaded(self.name, "rate_limit", wait)
+        if wait:
+            metrics.observe("scheduler_wait_seconds", wait, resource=self.name)
+            time.sleep(wait)
+
+
+RESOURCES = {
+    "cpu": FairSemaphore("cpu", _env_int("SCHED_CPU_CONCURRENCY", 1), _env_int("SCHED_CPU_MAX_QUEUE", 16), _env_int("SCHED_USER_MAX_QUEUE", 4)),
+    "asr": FairSemaphore("asr", _env_int("SCHED_ASR_CONCURRENCY", 8), _env_int("SCHED_ASR_MAX_QUEUE", 64), _env_int("SCHED_USER_MAX_QUEUE", 4) * 4),
+    "llm": FairSemaphore("llm", _env_int("SCHED_LLM_CONCURRENCY", 8), _env_int("SCHED_LLM_MAX_QUEUE", 64), _env_int("SCHED_USER_MAX_QUEUE", 4) * 4),
+}
+
+BUCKETS = {
+    # rate in requests/second; 0 disables the bucket
+    "whisper": TokenBucket("whisper", float(os.getenv("WHISPER_RPS", "0")), _env_int("WHISPER_BURST", 10)),
+    "gemini": TokenBucket("gemini", float(os.getenv("GEMINI_RPS", "0")), _env_int("GEMINI_BURST", 10)),
+}
+
+
+@contextmanager
+def slot(resource: str, upstream: str = None):
+    """Hold one unit of a resource class for the current user (and take an upstream token)."""
+    sem = RESOURCES[resource]
+    admitted = _admitted.get()
+    max_wait = None if admitted else MAX_WAIT_S
+    sem.acquire(current_user(), timeout=max_wait, bounded=not admitted)
+    t0 = time.perf_counter()
+    try:
+        if upstream:
+            BUCKETS[upstream].take(max_wait)
+        yield
+    finally:
+        sem.release(time.perf_counter() - t0)
+
+
+# ========= ADMISSION =========
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def admit(user: str, resources):
+    """Reserve a job for `user` on a heavy route; call finish(user) when done."""
+    set_user(user)
+    for r in resources:
+        RESOURCES[r].check(user)
+    with _jobs_lock:
+        if _jobs.get(user, 0) >= PER_USER_MAX_JOBS:
+            metrics.inc("scheduler_rejected_total", resource="jobs", reason="user_limit")
+            raise Overloaded("jobs", "user_limit", max(RESOURCES[r].avg_service for r in resources))
+        _jobs[user] = _jobs.get(user, 0) + 1
+    set_user(user, admitted=True)
+
+
+def finish(user: str):
+    with _jobs_lock:
+        _jobs[user] = max(0, _jobs.get(user, 1) - 1)
+        if not _jobs[user]:
+            del _jobs[user]
+
+
+def admission(resources, user_field: str = None):
+    """
+    FastAPI dependency for heavy routes: identifies the user (form field, else
+    client IP), fails fast with 429 when saturated and tracks the job until the
+    request finishes.
+    Not for streaming responses: the teardown runs before the body is sent, so
+    those routes call admit()/finish() around the stream themselves.
+    """
+    from fastapi import Request
+
+    async def dependency(request: Request):
+        user = None
+        if user_field:
+            form = await request.form()
+            user = form.get(user_field)
+        user = user or (request.client.host if request.client else "anonymous")
+        admit(user, resources)
+        try:
+            yield user
+        finally:
+            finish(user)
+
+    return dependency
@@ -0,0 +1,437 @@
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from services import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: lock with msvcrt instead
+    fcntl = None
+    import msvcrt
+
+# Lifecycle of files under uploads/:
+#   - temp files (request spools, converted WAVs) are removed on every exit path
+#     via discard()/temp_files()
+#   - finished practice answers are transcoded in the background to mono Opus
+#     (speech-grade, typically ~5-10x smaller than the browser's webm)
+#   - a sweeper evicts files older than STORAGE_MAX_AGE_DAYS, then least recently
+#     used files until every user is under STORAGE_USER_QUOTA_MB and the whole
+#     tree is under STORAGE_QUOTA_MB
+# Files newer than STORAGE_MIN_AGE_S or pinned by a running job are never evicted.
+# With several uvicorn workers, only the process holding uploads/.storage.lock
+# sweeps and archives; the others wait on the lock and take over if it exits.
+# Pins (uploads/.pins/) and the archive queue (uploads/.archive/) are marker
+# files, so every worker's jobs and finished sessions are seen by the leader.
+# Practice answers are owned by their uid (uploads/practice/<uid>/...); anything
+# else under uploads/ counts against the shared "_shared" owner.
+UPLOAD_ROOT = os.path.abspath(os.getenv("UPLOAD_ROOT", "uploads"))
+STORAGE_QUOTA_BYTES = int(float(os.getenv("STORAGE_QUOTA_MB", "5120")) * 2**20)
+STORAGE_USER_QUOTA_BYTES = int(float(os.getenv("STORAGE_USER_QUOTA_MB", "500")) * 2**20)
+STORAGE_MAX_AGE_S = float(os.getenv("STORAGE_MAX_AGE_DAYS", "30")) * 86400
+STORAGE_MIN_AGE_S = float(os.getenv("STORAGE_MIN_AGE_S", "3600"))
+STORAGE_SWEEP_S = float(os.getenv("STORAGE_SWEEP_S", "600"))
+ARCHIVE_OPUS = os.getenv("ARCHIVE_OPUS", "1") == "1"
+ARCHIVE_BITRATE = os.getenv("ARCHIVE_BITRATE", "24k")
+STORAGE_POLL_S = float(os.getenv("STORAGE_POLL_S", "5"))
+SHARED_OWNER = "_shared"
+LOCK_FILE, PIN_DIR, ARCHIVE_DIR, STATE_FILE, WAKE_FILE = ".storage.lock", ".pins", ".archive", ".storage.used", ".storage.wake"
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def remove(path: str, reason: str) -> int:
+    """Delete a file and record the reclaimed bytes; returns bytes freed (0 if already gone)."""
+    size = _size(path)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return 0
+    except OSError as e:
+        print(f"⚠️ Could not remove {path}: {e}")
+        return 0
+    if reason == "temp":  # request-scoped files, not evictions
+        metrics.inc("storage_temp_files_removed_total")
+        metrics.inc("storage_temp_bytes_removed_total", size)
+    else:
+        metrics.inc("storage_reclaimed_bytes_total", size, reason=reason)
+        metrics.inc("storage_evicted_files_total", reason=reason)
+    return size
+
+
+def discard(*paths):
+    """Remove temp files if they exist (safe to call on any exit path)."""
+    for p in paths:
+        if p and os.path.exists(p):
+            remove(p, "temp")
+
+
+def resolve(path: str) -> str:
+    """Path of an upload, or of its archived .opus copy if it has been transcoded."""
+    if os.path.exists(path):
+        return path
+    archived = os.path.splitext(path)[0] + ".opus"
+    return archived if os.path.exists(archived) else path
+
+
+@contextmanager
+def temp_files(*paths):
+    try:
+        yield paths
+    finally:
+        discard(*paths)
+
+
+class StorageManager:
+    def __init__(self, root: str = UPLOAD_ROOT):
+        self.root = root
+        self.pin_dir = os.path.join(root, PIN_DIR)
+        self.archive_dir = os.path.join(root, ARCHIVE_DIR)
+        self.lock = threading.Lock()
+        self.used = 0  # bytes at the leader's last sweep plus writes noted by this process since
+        self.state_mtime = None
+        self.wake = threading.Event()
+        self.archive_wake = threading.Event()
+        self.leader = False
+        self.lock_fd = None
+        self.threads = []
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    # ---------- bookkeeping ----------
+    def owner(self, path: str) -> str:
+        parts = os.path.relpath(path, self.root).split(os.sep)
+        if parts[0] == "practice" and len(parts) > 2:
+            return parts[1]
+        return SHARED_OWNER
+
+    @contextmanager
+    def pin(self, path: str):
+        """Protect a file or directory from eviction while a job (in any worker) uses it."""
+        path = os.path.abspath(path)
+        os.makedirs(self.pin_dir, exist_ok=True)
+        marker = os.path.join(self.pin_dir, f"{os.getpid()}-{_start_time(os.getpid())}-{uuid.uuid4().hex}")
+        with open(marker, "w", encoding="utf-8") as f:
+            f.write(path)
+        try:
+            yield path
+        finally:
+            _unlink(marker)
+
+    def pins(self):
+        """Paths pinned by live processes; markers left by dead workers are removed."""
+        pinned = set()
+        try:
+            markers = os.listdir(self.pin_dir)
+        except FileNotFoundError:
+            return pinned
+        for name in markers:
+            marker = os.path.join(self.pin_dir, name)
+            pid, started, _ = (name.split("-", 2) + ["", ""])[:3]
+            if not _alive(pid, started):
+                _unlink(marker)
+                continue
+            try:
+                with open(marker, encoding="utf-8") as f:
+                    pinned.add(f.read())
+            except OSError:
+                continue
+        return pinned
+
+    @staticmethod
+    def _is_pinned(path, pinned):
+        return any(path == p or path.startswith(p + os.sep) for p in pinned)
+
+    def written(self, path: str):
+        """Note a new file under uploads/; asks the leader for an early sweep when over quota."""
+        size = _size(path)
+        try:
+            mtime = os.path.getmtime(self._path(STATE_FILE))
+        except OSError:
+            mtime = None
+        with self.lock:
+            if mtime != self.state_mtime:  # the leader swept since; start from its total
+                self.state_mtime = mtime
+                self.used = _read_int(self._path(STATE_FILE))
+            self.used += size
+            used = self.used
+        metrics.set_gauge("storage_used_bytes", used)
+        if used > STORAGE_QUOTA_BYTES:
+            _touch(self._path(WAKE_FILE))
+            self.wake.set()
+
+    # ---------- eviction ----------
+    def scan(self):
+        files = []
+        for dirpath, dirnames, names in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]  # pins, archive queue
+            for name in names:
+                if name.startswith(".storage."):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                # atime is often disabled (noatime); mtime covers writes and archival
+                files.append({"path": path, "size": st.st_size, "used": max(st.st_atime, st.st_mtime), "owner": self.owner(path)})
+        return files
+
+    def sweep(self):
+        t0 = time.perf_counter()
+        now = time.time()
+        files = self.scan()
+        # Pins are re-read before each eviction pass so jobs started mid-sweep are respected
+        evictable = lambda f, pinned: not self._is_pinned(f["path"], pinned) and now - f["used"] >= STORAGE_MIN_AGE_S
+
+        kept = []
+        pinned = self.pins()
+        for f in files:
+            if evictable(f, pinned) and now - f["used"] > STORAGE_MAX_AGE_S:
+                remove(f["path"], "age")
+            else:
+                kept.append(f)
+
+        # Per-user quota, least recently used first
+        by_owner = {}
+        for f in kept:
+            by_owner.setdefault(f["owner"], []).append(f)
+        pinned = self.pins()
+        for owner, owned in by_owner.items():
+            used = sum(f["size"] for f in owned)
+            for f in sorted((f for f in owned if evictable(f, pinned)), key=lambda f: f["used"]):
+                if used <= STORAGE_USER_QUOTA_BYTES:
+                    break
+                used -= remove(f["path"], "user_quota")
+                f["size"] = 0
+
+        # Global quota
+        kept = [f for f in kept if f["size"]]
+        used = sum(f["size"] for f in kept)
+        pinned = self.pins()
+        for f in sorted((f for f in kept if evictable(f, pinned)), key=lambda f: f["used"]):
+            if used <= STORAGE_QUOTA_BYTES:
+                break
+            used -= remove(f["path"], "global_quota")
+            f["size"] = 0
+
+        self._prune_dirs(self.pins())
+        kept = [f for f in kept if f["size"]]
+        _write_int(self._path(STATE_FILE), used)
+        metrics.set_gauge("storage_used_bytes", used)
+        metrics.set_gauge("storage_files", len(kept))
+        metrics.set_gauge("storage_owners_over_quota", sum(
+            1 for owned in by_owner.values() if sum(f["size"] for f in owned) > STORAGE_USER_QUOTA_BYTES))
+        metrics.observe("storage_sweep_seconds", time.perf_counter() - t0)
+        return {"usedBytes": used, "files": len(kept)}
+
+    def _prune_dirs(self, pinned):
+        practice = os.path.join(self.root, "practice")
+        for dirpath, dirnames, filenames in os.walk(practice, topdown=False):
+            if dirpath != practice and not dirnames and not filenames and not self._is_pinned(dirpath, pinned):
+                try:
+                    os.rmdir(dirpath)
+                except OSError:
+                    pass
+
+    def usage(self):
+        files = self.scan()
+        owners = {}
+        for f in files:
+            o = owners.setdefault(f["owner"], {"bytes": 0, "files": 0})
+            o["bytes"] += f["size"]
+            o["files"] += 1
+        top = sorted(owners.items(), key=lambda kv: -kv[1]["bytes"])[:20]
+        return {
+            "root": self.root,
+            "usedBytes": sum(f["size"] for f in files),
+            "files": len(files),
+            "quotaBytes": STORAGE_QUOTA_BYTES,
+            "userQuotaBytes": STORAGE_USER_QUOTA_BYTES,
+            "topOwners": dict(top),
+            "pendingArchive": len(self._archive_markers()),
+            "leader": self.leader,
+        }
+
+    # ---------- archival ----------
+    def archive_later(self, *paths):
+        """Queue finished raw uploads for background transcoding to mono Opus (by the leader)."""
+        if not ARCHIVE_OPUS:
+            return
+        os.makedirs(self.archive_dir, exist_ok=True)
+        for p in paths:
+            if p and not p.endswith(".opus"):
+                marker = os.path.join(self.archive_dir, f"{time.time_ns()}-{uuid.uuid4().hex}")
+                with open(marker + ".tmp", "w", encoding="utf-8") as f:
+                    f.write(os.path.abspath(p))
+                os.replace(marker + ".tmp", marker)
+        self.archive_wake.set()
+        metrics.set_gauge("storage_archive_queue", len(self._archive_markers()))
+
+    def _archive_markers(self):
+        try:
+            return sorted(n for n in os.listdir(self.archive_dir) if not n.endswith(".tmp"))
+        except FileNotFoundError:
+            return []
+
+    def archive(self, path: str):
+        """Transcode to mono Opus next to the original; keeps whichever file is smaller."""
+        import ffmpeg
+
+        if not os.path.exists(path):
+            return None
+        dst = os.path.splitext(path)[0] + ".opus"
+        tmp = dst + ".part"
+        try:
+            with metrics.stage("archive"):
+                (
+                    ffmpeg
+                    .input(path)
+                    .output(tmp, format="opus", ac=1, ar="16000", acodec="libopus",
+                            audio_bitrate=ARCHIVE_BITRATE, application="voip", vn=None)
+                    .overwrite_output()
+                    .run(quiet=True)
+                )
+        except Exception as e:
+            discard(tmp)
+            print(f"⚠️ Archival failed for {path}: {e}")
+            return None
+        before, after = _size(path), _size(tmp)
+        if not after or after >= before:
+            discard(tmp)
+            return path
+        os.replace(tmp, dst)
+        os.remove(path)
+        metrics.inc("storage_reclaimed_bytes_total", before - after, reason="archive")
+        with self.lock:
+            self.used -= before - after
+        return dst
+
+    def _archive_worker(self):
+        while True:
+            for name in self._archive_markers():
+                marker = os.path.join(self.archive_dir, name)
+                try:
+                    with open(marker, encoding="utf-8") as f:
+                        path = f.read()
+                    with self.pin(path):
+                        self.archive(path)
+                except Exception as e:
+                    print(f"⚠️ Archival failed for {marker}: {e}")
+                finally:
+                    _unlink(marker)
+                    metrics.set_gauge("storage_archive_queue", len(self._archive_markers()))
+            # Other workers can't signal this process directly; poll their queue entries
+            self.archive_wake.wait(STORAGE_POLL_S)
+            self.archive_wake.clear()
+
+    def _sweeper(self):
+        wake_file = self._path(WAKE_FILE)
+        while True:
+            _unlink(wake_file)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"⚠️ Storage sweep failed: {e}")
+            deadline = time.monotonic() + STORAGE_SWEEP_S
+            while time.monotonic() < deadline and not os.path.exists(wake_file):
+                if self.wake.wait(min(STORAGE_POLL_S, max(0, deadline - time.monotonic()))):
+                    break
+            self.wake.clear()
+
+    def _lead(self):
+        """Wait for the storage lock, then sweep and archive on behalf of every worker."""
+        self.lock_fd = os.open(self._path(LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o600)
+        _lock_exclusive(self.lock_fd)  # the OS releases it if this worker dies
+        self.leader = True
+        print(f"🧹 Storage sweeper and archiver running in pid {os.getpid()}")
+        t = threading.Thread(target=self._archive_worker, name="storage-archiver", daemon=True)
+        t.start()
+        self.threads.append(t)
+        self._sweeper()
+
+    def start(self):
+        if self.threads:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        t = threading.Thread(target=self._lead, name="storage-sweeper", daemon=True)
+        t.start()
+        self.threads.append(t)
+
+
+def _lock_exclusive(fd):
+    """Block until this process holds an exclusive lock on `fd`."""
+    if fcntl:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return
+    while True:
+        try:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return
+        except OSError:
+            time.sleep(STORAGE_POLL_S)
+
+
+def _start_time(pid) -> str:
+    """Process start time in clock ticks (tells a live pin owner from a reused pid)."""
+    if not os.path.isdir("/proc"):
+        return ""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return ""
+
+
+def _alive(pid: str, started: str) -> bool:
+    if os.name != "posix":
+        return True  # os.kill(pid, 0) would send CTRL_C_EVENT on Windows, not probe
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    current = _start_time(pid)
+    return not current or not started or current == started
+
+
+def _unlink(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _touch(path):
+    try:
+        with open(path, "a"):
+            pass
+    except OSError:
+        pass
+
+
+def _read_int(path) -> int:
+    try:
+        with open(path) as f:
+            return int(f.read() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def _write_int(path, value: int):
+    with open(path + ".tmp", "w") as f:
+        f.write(str(value))
+    os.replace(path + ".tmp", path)
+
+
+manager = StorageManager()
@@ -0,0 +1,184 @@
+import contextvars
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from services import metrics
+from services.scheduler import Overloaded
+
+# Token-aware compaction of long transcripts before the final feedback prompt.
+# Transcripts under the budget are sent as-is. Longer ones are split by question
+# (practice "Qn:" blocks) or by sentence, each chunk is summarised in parallel
+# (map), and the summaries replace the raw text in the feedback prompt (reduce).
+# Chunk summaries are cached by content hash, so re-analysing a transcript only
+# re-sends the chunks that changed.
+CHUNK_TOKENS = int(os.getenv("TRANSCRIPT_CHUNK_TOKENS", "1200"))
+MAP_WORKERS = int(os.getenv("TRANSCRIPT_MAP_WORKERS", "4"))
+CACHE_SIZE = int(os.getenv("TRANSCRIPT_CACHE_SIZE", "2048"))
+# Fixed summary length per chunk: the cache key must not depend on how many
+# chunks the transcript has, or appending text would invalidate every chunk
+SUMMARY_WORDS = int(os.getenv("TRANSCRIPT_SUMMARY_WORDS", "120"))
+CHARS_PER_TOKEN = 4  # Gemini averages ~4 characters per token for English
+PROMPT_VERSION = "v2"
+
+MAP_PROMPT = """
+You are condensing part of a job-interview transcript for an interview coach.
+Keep: the question being answered, the candidate's main points, concrete examples,
+numbers, technologies, STAR structure (or its absence), hesitations and vague or
+off-topic answers. Write plain sentences in the third person, at most {words} words.
+Do not evaluate or score.
+
+Transcript part {index} of {total}:
+\"\"\"{chunk}\"\"\"
+""".strip()
+
+_cache = OrderedDict()  # sha256 -> {"summary", "seconds", "tokens"}
+_cache_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _sentences(text: str):
+    return [s for s in re.split(r"(?<=[.!?])\s+", text.strip()) if s]
+
+
+def _is_anchor(sentence: str, target_tokens: int) -> bool:
+    """Content-defined cut point: depends only on the sentence itself, so an edit
+    moves at most the boundaries next to it. Cuts every ~target_tokens on average."""
+    h = int.from_bytes(hashlib.sha1(sentence.encode()).digest()[:4], "big") / 2**32
+    return h < estimate_tokens(sentence) / target_tokens
+
+
+def _pack_stable(pieces, max_tokens):
+    """Pack pieces into chunks of at most max_tokens, cutting on content-defined anchors."""
+    target = max(1, max_tokens // 2)
+    chunks, cur = [], []
+    cur_tokens = 0
+    step = max_tokens * CHARS_PER_TOKEN
+    # Hard-split oversized pieces on their own so neighbouring pieces stay untouched
+    pieces = [p[i:i + step] for p in pieces for i in range(0, len(p), step)]
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if cur and cur_tokens + tokens > max_tokens:
+            chunks.append(" ".join(cur))
+            cur, cur_tokens = [], 0
+        cur.append(piece)
+        cur_tokens += tokens
+        if cur_tokens >= target // 4 and _is_anchor(piece, target):
+            chunks.append(" ".join(cur))
+            cur, cur_tokens = [], 0
+    if cur:
+        chunks.append(" ".join(cur))
+    return chunks
+
+
+def split_transcript(transcript: str, max_tokens: int = CHUNK_TOKENS):
+    """Split by question block when present ("Q1: ..."), otherwise by sentence."""
+    blocks = [b.strip() for b in re.split(r"(?m)^(?=Q\d+:)", transcript) if b.strip()]
+    if len(blocks) > 1:
+        chunks = []
+        for block in blocks:
+            if estimate_tokens(block) <= max_tokens:
+                chunks.append(block)
+            else:
+                header, _, body = block.partition("\n")
+                if not body.strip():
+                    # Whole answer on the header line: keep the "Qn:" label, pack the rest
+                    label = re.match(r"Q\d+:", block).group(0)
+                    header, body = label, block[len(label):].strip()
+                chunks.extend(f"{header} (cont.)\n{c}" if i else f"{header}\n{c}"
+                              for i, c in enumerate(_pack_stable(_sentences(body), max_tokens)))
+        return chunks
+    return _pack_stable(_sentences(transcript), max_tokens)
+
+
+def _cache_get(key):
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is not None:
+            _cache.move_to_end(key)
+    metrics.record_cache("transcript_summary", hit is not None)
+    return hit
+
+
+def _cache_put(key, value):
+    with _cache_lock:
+        _cache[key] = value
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _summarize_chunks(chunks, generate, words, stats):
+    keys = [hashlib.sha256(f"{PROMPT_VERSION}:{words}:{c}".encode()).hexdigest() for c in chunks]
+    summaries = [None] * len(chunks)
+    todo = []
+    for i, key in enumerate(keys):
+        hit = _cache_get(key)
+        if hit:
+            summaries[i] = hit["summary"]
+            stats["cachedChunks"] += 1
+            stats["llmSecondsSaved"] += hit["seconds"]
+            stats["tokensSaved"] += hit["tokens"]
+        else:
+            todo.append(i)
+
+    def _map(i):
+        prompt = MAP_PROMPT.format(words=words, index=i + 1, total=len(chunks), chunk=chunks[i])
+        t0 = time.perf_counter()
+        with metrics.stage("llm_map"):
+            text = (generate(prompt) or "").strip()
+        if not text:
+            raise ValueError("Empty summary")
+        _cache_put(keys[i], {"summary": text, "seconds": time.perf_counter() - t0, "tokens": estimate_tokens(prompt)})
+        return text
+
+    if todo:
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(MAP_WORKERS, len(todo))) as pool:
+            # copy_context keeps the request's trace ID inside the worker threads
+            futures = {i: pool.submit(contextvars.copy_context().run, _map, i) for i in todo}
+            for i, fut in futures.items():
+                try:
+                    summaries[i] = fut.result()
+                    stats["sentTokens"] += estimate_tokens(chunks[i])
+                except Overloaded:
+                    raise  # overload is the caller's to report, not a silently shorter summary
+                except Exception as e:
+                    print(f"⚠️ Chunk {i + 1} summary failed, keeping raw head: {e}")
+                    stats["failedChunks"] += 1
+                    summaries[i] = chunks[i][:words * 6]
+        stats["mapSeconds"] += round(time.perf_counter() - t0, 3)
+    return summaries
+
+
+def compact_transcript(transcript: str, generate, budget_tokens: int, chunk_tokens: int = CHUNK_TOKENS):
+    """
+    Return (text, stats) where text fits in budget_tokens.
+    `generate` is a prompt -> text callable (e.g. gemini_generate).
+    """
+    original = estimate_tokens(transcript)
+    stats = {
+        "originalTokens": original, "finalTokens": original, "chunks": 0, "cachedChunks": 0,
+        "failedChunks": 0, "sentTokens": 0, "tokensSaved": 0, "mapSeconds": 0.0,
+        "llmSecondsSaved": 0.0, "levels": 0,
+    }
+    text = transcript
+    # Reduce level by level until the combined summaries fit in the budget
+    while estimate_tokens(text) > budget_tokens and stats["levels"] < 3:
+        chunks = split_transcript(text, chunk_tokens)
+        summaries = _summarize_chunks(chunks, generate, SUMMARY_WORDS, stats)
+        text = "\n\n".join(summaries)
+        stats["chunks"] += len(chunks)
+        stats["levels"] += 1
+    if estimate_tokens(text) > budget_tokens:
+        text = text[:budget_tokens * CHARS_PER_TOKEN]
+    stats["finalTokens"] = estimate_tokens(text)
+    stats["llmSecondsSaved"] = round(stats["llmSecondsSaved"], 3)
+    return text, stats
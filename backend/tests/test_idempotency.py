@@ -0,0 +1,34 @@
+import time
+
+from services.idempotency import IdempotencyStore
+
+
+def test_content_keys_expire_shortly_after_completion():
+    store = IdempotencyStore(ttl=3600)
+    entry, owner = store.begin("analyze:u:sha256:x", ttl=0.05)
+    assert owner
+    _, owner = store.begin("analyze:u:sha256:x", ttl=0.05)
+    assert not owner  # still running: attach
+    store.complete(entry, {"ok": True})
+    _, owner = store.begin("analyze:u:sha256:x", ttl=0.05)
+    assert not owner
+    time.sleep(0.06)
+    _, owner = store.begin("analyze:u:sha256:x", ttl=0.05)
+    assert owner
+
+
+def test_client_keys_use_the_store_ttl():
+    store = IdempotencyStore(ttl=3600)
+    entry, _ = store.begin("analyze:u:key:abc")
+    store.complete(entry, {"ok": True})
+    time.sleep(0.01)
+    again, owner = store.begin("analyze:u:key:abc")
+    assert not owner and again.result == {"ok": True}
+
+
+def test_failed_entries_are_forgotten():
+    store = IdempotencyStore()
+    entry, _ = store.begin("k")
+    store.fail(entry)
+    _, owner = store.begin("k")
+    assert owner
@@ -0,0 +1,102 @@
+import contextvars
+import threading
+import time
+
+import pytest
+
+from services import scheduler
+from services.scheduler import FairSemaphore, Overloaded, TokenBucket
+
+
+def _queue(sem, user, target, *args):
+    """Start a waiter for `user` and return once it is queued (keeps the arrival order fixed)."""
+    before = sum(sem.queued.values())
+    ctx = contextvars.copy_context()
+    t = threading.Thread(target=ctx.run, args=(target,) + args, daemon=True)
+    t.start()
+    deadline = time.time() + 2
+    while sum(sem.queued.values()) == before and time.time() < deadline:
+        time.sleep(0.001)
+    return t
+
+
+def test_fair_queuing_serves_a_light_user_before_a_heavy_users_backlog():
+    sem = FairSemaphore("t", capacity=1, max_queue=10, max_user_queue=10)
+    order = []
+
+    def run(name, user):
+        sem.acquire(user, timeout=5)
+        order.append(name)
+        sem.release(0.0)
+
+    sem.acquire("holder")
+    threads = [_queue(sem, "a", run, f"a{i}", "a") for i in range(3)]
+    threads.append(_queue(sem, "b", run, "b0", "b"))
+    sem.release(0.0)
+    for t in threads:
+        t.join(2)
+    assert order == ["a0", "b0", "a1", "a2"]
+
+
+def test_full_queue_rejects_new_waiters():
+    sem = FairSemaphore("t", capacity=1, max_queue=1, max_user_queue=1)
+    sem.acquire("holder")
+    waiter = _queue(sem, "a", sem.acquire, "a", 5)
+    with pytest.raises(Overloaded) as e:
+        sem.acquire("b", timeout=5)
+    assert e.value.reason == "queue_full"
+    with pytest.raises(Overloaded):
+        sem.check("b")
+    sem.release(0.0)
+    waiter.join(2)
+    sem.release(0.0)
+
+
+def test_timed_out_waiters_are_not_charged():
+    sem = FairSemaphore("t", capacity=1, max_queue=10, max_user_queue=10)
+    sem.acquire("holder")
+    with pytest.raises(Overloaded) as e:
+        sem.acquire("a", timeout=0.01)
+    assert e.value.reason == "timeout"
+    assert "a" not in sem.last_tag
+    sem.release(0.0)
+
+
+def test_admitted_jobs_wait_for_a_full_stage_instead_of_failing(monkeypatch):
+    sem = FairSemaphore("cpu", capacity=1, max_queue=1, max_user_queue=1)
+    monkeypatch.setitem(scheduler.RESOURCES, "cpu", sem)
+    monkeypatch.setattr(scheduler, "MAX_WAIT_S", 0.01)
+    sem.acquire("holder")
+    _queue(sem, "a", sem.acquire, "a", 5)
+    done = []
+
+    def stage():
+        scheduler.set_user("b", admitted=True)
+        with scheduler.slot("cpu"):
+            done.append(True)
+
+    t = _queue(sem, "b", stage)
+    time.sleep(0.05)  # well past MAX_WAIT_S, and the queue was already full
+    assert not done
+    sem.release(0.0)  # to "a"
+    sem.release(0.0)  # to "b"
+    t.join(2)
+    assert done
+
+
+def test_token_bucket_refills_and_reports_retry_after():
+    bucket = TokenBucket("t", rate=10, burst=2)
+    bucket.take(max_wait=0)
+    bucket.take(max_wait=0)
+    with pytest.raises(Overloaded) as e:
+        bucket.take(max_wait=0)
+    assert e.value.reason == "rate_limit"
+    assert e.value.retry_after == 1
+    time.sleep(0.15)
+    bucket.take(max_wait=0)
+
+    slow = TokenBucket("t", rate=0.1, burst=1)
+    slow.take(max_wait=0)
+    with pytest.raises(Overloaded) as e:
+        slow.take(max_wait=1)
+    assert e.value.retry_after == 10
@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+import time
+
+from services import storage
+from services.storage import StorageManager
+
+
+def _old_file(path, size=1024, age_days=400):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    t = time.time() - age_days * 86400
+    os.utime(path, (t, t))
+    return path
+
+
+def test_pin_from_another_manager_is_respected(tmp_path):
+    root = str(tmp_path)
+    pinned = _old_file(os.path.join(root, "practice", "uid1", "s1", "a.webm"))
+    stale = _old_file(os.path.join(root, "practice", "uid1", "s2", "b.webm"))
+    worker, leader = StorageManager(root), StorageManager(root)
+    with worker.pin(os.path.dirname(pinned)):
+        leader.sweep()
+        assert os.path.exists(pinned)
+        assert not os.path.exists(stale)
+    leader.sweep()
+    assert not os.path.exists(pinned)
+
+
+def test_pins_of_dead_processes_are_ignored(tmp_path):
+    root = str(tmp_path)
+    path = _old_file(os.path.join(root, "old.wav"))
+    child = subprocess.Popen([sys.executable, "-c", "pass"])
+    child.wait()
+    os.makedirs(os.path.join(root, storage.PIN_DIR))
+    marker = os.path.join(root, storage.PIN_DIR, f"{child.pid}-0-abc")
+    with open(marker, "w") as f:
+        f.write(path)
+    StorageManager(root).sweep()
+    assert not os.path.exists(path)
+    assert not os.path.exists(marker)
+
+
+def test_markers_are_not_counted_as_uploads(tmp_path):
+    root = str(tmp_path)
+    manager = StorageManager(root)
+    _old_file(os.path.join(root, "a.wav"), age_days=0)
+    manager.archive_later(os.path.join(root, "a.wav"))
+    with manager.pin(root):
+        usage = manager.usage()
+    assert usage["files"] == 1
+    assert usage["pendingArchive"] == 1
+
+
+def test_only_one_manager_sweeps(tmp_path):
+    root = str(tmp_path)
+    first, second = StorageManager(root), StorageManager(root)
+    first.start()
+    deadline = time.time() + 5
+    while not first.leader and time.time() < deadline:
+        time.sleep(0.01)
+    second.start()
+    time.sleep(0.2)
+    assert first.leader
+    assert not second.leader
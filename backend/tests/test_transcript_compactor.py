@@ -0,0 +1,50 @@
+import re
+
+from services.transcript_compactor import split_transcript
+
+
+def _words(text):
+    # Chunk headers may repeat "(cont.)"; everything else must survive splitting
+    return [w for w in re.findall(r"\S+", text) if w != "(cont.)"]
+
+
+def test_single_line_question_block_is_not_dropped():
+    long_answer = " ".join(f"word{i}." for i in range(3000))
+    transcript = f"Q1: {long_answer}\n\nQ2: Short answer."
+    chunks = split_transcript(transcript, max_tokens=500)
+    assert len(chunks) > 2
+    assert all(c.startswith("Q1:") for c in chunks[:-1])
+    assert sorted(_words(" ".join(chunks))) == sorted(_words(transcript) + ["Q1:"] * (len(chunks) - 2))
+
+
+def test_no_text_lost_without_question_blocks():
+    transcript = " ".join(f"Sentence number {i} is here." for i in range(800))
+    chunks = split_transcript(transcript, max_tokens=300)
+    assert _words(" ".join(chunks)) == _words(transcript)
+
+
+def _compact_twice(first, second):
+    from services import transcript_compactor as tc
+
+    tc._cache.clear()
+    generate = lambda prompt: "summary of " + str(hash(prompt))
+    tc.compact_transcript(first, generate, budget_tokens=500, chunk_tokens=400)
+    _, stats = tc.compact_transcript(second, generate, budget_tokens=500, chunk_tokens=400)
+    return stats
+
+
+def _sentences(n, start=0):
+    return " ".join(f"In sentence {i} the candidate describes project {i * 7} in detail." for i in range(start, start + n))
+
+
+def test_appending_text_reuses_cached_chunks():
+    base = _sentences(300)
+    stats = _compact_twice(base, base + " " + _sentences(200, start=300))
+    # Only the chunk at the old end of the text may change
+    assert stats["cachedChunks"] >= len(split_transcript(base, 400)) - 1
+
+
+def test_editing_first_sentence_reuses_later_chunks():
+    base = _sentences(300)
+    stats = _compact_twice(base, "Hello there, this is an edited opening. " + base[base.index(".") + 2:])
+    assert stats["cachedChunks"] >= stats["chunks"] - 2